@@ -20,6 +20,7 @@ a = Analysis(
         'nicegui',
         'socketio',
         'engineio',
+        'msgpack',
         'pystray',
         'PIL',
         'aiohttp',
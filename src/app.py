@@ -14,6 +14,18 @@ if sys.stderr is None:
 if sys.stdin is None:
     sys.stdin = open(os.devnull, 'r')
 
+# Render pool workers of the frozen exe start here too: run their task and
+# exit before the imports and setup below (web UI, client, journal, log file)
+import multiprocessing
+multiprocessing.freeze_support()
+
+# Add src to path if running as script
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Before anything heavy: times startup phases, and imports with --profile-startup
+from src.startup import startup_profile
+
 # Now safe to import everything else
 import threading
 import asyncio
@@ -25,25 +37,28 @@ if getattr(sys, 'frozen', False):
     # Running as compiled exe - log next to exe
     LOG_FILE = os.path.join(os.path.dirname(sys.executable), 'printsalot.log')
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, mode='a'),
-    ]
-)
+from src.config_manager import config_manager
+from src.log_setup import LEVELS, get_level, set_level, setup_logging
+
+# Rotating, redacted, written from a background thread; level and sizes from the `logging` config section
+setup_logging(LOG_FILE)
 logger = logging.getLogger('PrintsAlot')
 logger.info("PrintsAlot starting...")
+startup_profile.mark('config')
 
-# Add src to path if running as script
-if __name__ == "__main__":
-    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+from fastapi.responses import Response
 from nicegui import ui, app
+from src import metrics
 from src.client import printer_client, CLIENT_VERSION
-from src.config_manager import config_manager
 from src.tray import TrayIcon, setup_autostart, is_autostart_enabled
 from src.updater import updater
+from src.fetcher import image_fetcher
+from src.status_monitor import status_monitor
+from src.jobs import print_queue
+from src.journal import job_journal
+from src.render_pool import render_pool
+from src.config_watcher import config_watcher
+startup_profile.mark('imports')
 
 # Default port for the web UI
 WEB_PORT = 8456
@@ -62,6 +77,30 @@ def update_status_label(label):
         label.classes('text-red-400', remove='text-green-400')
 
 
+async def refresh_update_info():
+    global update_info
+    update_info = await printer_client.check_for_updates()
+
+
+async def open_printers():
+    """Open the printers after startup, so USB setup doesn't hold up the web UI."""
+    await print_queue.open_printers()
+    startup_profile.mark('printer_ready')
+
+
+async def load_first_page(port: int):
+    """For --profile-startup: request the UI the way a browser would, as soon as the server answers."""
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/') as resp:
+                    await resp.read()
+                    return
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.05)
+
+
 @ui.page('/')
 async def main_page():
     ui.dark_mode().enable()
@@ -110,9 +149,8 @@ async def main_page():
     global connection_status
     connection_status = "Connected" if printer_client.connected else "Disconnected"
     
-    # Check for updates on page load
-    global update_info
-    update_info = await printer_client.check_for_updates()
+    # Show the last update check and refresh it for the next load, rather than waiting on the relay here
+    asyncio.create_task(refresh_update_info())
     
     # UI Layout
     with ui.column().classes('w-full max-w-lg mx-auto mt-10 p-4 gap-4'):
@@ -263,6 +301,12 @@ async def main_page():
                 
                 max_height_input = ui.number(label='Max Image Height (px)', value=current_settings.get('max_px_height', 2000)).classes('w-full')
                 
+                dither_input = ui.select(
+                    label='Dithering',
+                    options={'floyd': 'Floyd-Steinberg', 'bayer': 'Ordered (Bayer)', 'threshold': 'Threshold'},
+                    value=current_settings.get('dither', 'floyd')
+                ).classes('w-full')
+                
                 auto_cut_input = ui.checkbox('Auto Cut Paper', value=current_settings.get('auto_cut', True)).classes('mt-2')
 
                 async def save_settings():
@@ -277,13 +321,16 @@ async def main_page():
                             
                         max_prints = int(max_prints_input.value)
                         
+                        # Merge so receiver-only keys (e.g. dither) survive a save
                         new_settings = {
+                            **config_manager.get('printer_settings', {}),
                             'timezone': timezone_select.value,
                             'width': width,
                             'max_prints_per_day': max_prints,
                             'max_prints_per_user_per_day': int(max_user_prints_input.value),
                             'max_px_height': int(max_height_input.value),
-                            'auto_cut': auto_cut_input.value
+                            'auto_cut': auto_cut_input.value,
+                            'dither': dither_input.value
                         }
                         
                         config_manager.set('printer_settings', new_settings)
@@ -310,12 +357,29 @@ async def main_page():
                 
                 autostart_checkbox.on('change', toggle_autostart)
 
+                log_level_select = ui.select(label='Log Level', options=list(LEVELS), value=get_level()).classes('w-full')
+
+                def change_log_level():
+                    set_level(log_level_select.value)
+                    config_manager.set('logging', {**config_manager.get('logging', {}), 'level': log_level_select.value})
+                    ui.notify(f'Logging at {log_level_select.value}', type='info')
+
+                log_level_select.on_value_change(change_log_level)
+
         # Footer
         with ui.row().classes('w-full justify-center gap-4 mt-8 text-gray-500 text-sm'):
             ui.label('Powered by PrinterBot')
             ui.link('Command Guide', 'https://printerbot.dragnai.dev/commands').classes('text-primary hover:underline')
             ui.link('Website', 'https://printerbot.dragnai.dev').classes('text-primary hover:underline')
 
+    startup_profile.mark('first_page')
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Prometheus scrape target. Async so it reads the metrics on the loop thread that writes them."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 
 def run_tray(port: int):
     """Run the system tray icon in a separate thread."""
@@ -372,15 +436,37 @@ def main():
     parser.add_argument('--setup', action='store_true', help='Run first-time setup')
     parser.add_argument('--no-tray', action='store_true', help='Run without system tray')
     parser.add_argument('--port', type=int, default=WEB_PORT, help=f'Web UI port (default: {WEB_PORT})')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print import and startup phase timings once the receiver is up')
     args = parser.parse_args()
     
     # First-time setup (uses GUI dialog, works without console)
     if args.setup:
         run_setup_dialog()
     
-    # Start printer client connection
+    app.on_startup(lambda: startup_profile.mark('server'))
+    if args.profile_startup:
+        app.on_startup(lambda: load_first_page(args.port))
+        app.on_startup(startup_profile.report_after_timeout)
+
+    # Resume jobs left unfinished by a restart or crash, then connect
+    app.on_startup(print_queue.recover)
+    app.on_shutdown(job_journal.close)
     app.on_startup(printer_client.connect)
+    app.on_startup(refresh_update_info)
     app.on_shutdown(printer_client.disconnect)
+    app.on_shutdown(image_fetcher.close)
+    app.on_shutdown(render_pool.close)
+    app.on_shutdown(config_manager.flush)
+
+    # Pick up edits to config.json without a restart
+    app.on_startup(config_watcher.start)
+    app.on_shutdown(config_watcher.stop)
+    
+    # Open the printers in the background, then poll their status (paper, cover)
+    app.on_startup(open_printers)
+    app.on_startup(status_monitor.start)
+    app.on_shutdown(status_monitor.stop)
     
     # Start tray icon in background thread (unless disabled)
     if not args.no_tray:
@@ -0,0 +1,384 @@
+"""
+End-to-end load generator for PrintsAlot.
+Runs the real PrinterClient against a local stand-in for the relay (a
+python-socketio server speaking the same events) and a local file server,
+printing to a simulated printer, and reports throughput, latency, memory
+and event-loop lag as JSON. The receiver runs in its own process, so its
+memory and loop lag are measured apart from the relay stand-in.
+
+    python -m src.bench --jobs 200 --rate 20 --payload url --size 800x1200
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import socketio
+from aiohttp import web
+from PIL import Image
+
+logger = logging.getLogger('PrintsAlot.bench')
+
+BENCH_TOKEN = 'bench-token'
+LAG_INTERVAL = 0.01
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of seconds, in milliseconds."""
+    return {
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p95': round(percentile(values, 95) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'max': round(max(values, default=0.0) * 1000, 2),
+        'mean': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def make_images(count: int, size: str, fmt: str) -> List[bytes]:
+    """`count` distinct noise images, so every job is a raster cache miss."""
+    width, height = (int(v) for v in size.lower().split('x'))
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        img = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG' if fmt == 'jpeg' else 'PNG')
+        images.append(buf.getvalue())
+    return images
+
+
+class Relay:
+    """
+    Stand-in for the relay server, run on its own thread and event loop so
+    its work doesn't show up as lag on the client's loop. Issues a token to
+    an unlinked client, rotates it mid-run, sends print jobs and records
+    when each job_update comes back.
+    """
+
+    def __init__(self, port: int, files_port: int, images: List[bytes], fmt: str, serializer: str):
+        self.port = port
+        self.files_port = files_port
+        self.images = images
+        self.ext = 'jpg' if fmt == 'jpeg' else 'png'
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', serializer=serializer)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.linked_sid: Optional[str] = None
+        self.linked = threading.Event()
+        self.ready = threading.Event()
+
+        self.sent_at: Dict[str, float] = {}
+        self.updates: Dict[str, Dict[str, Any]] = {}
+        self.done_at: Dict[str, float] = {}
+        self.expected = 0  # jobs to be sent in this run
+        self.all_done = threading.Event()
+        self.events: Dict[str, int] = {}
+
+        self.sio.on('connect', self._on_connect)
+        self.sio.on('disconnect', self._on_disconnect)
+        self.sio.on('job_update', self._on_job_update)
+        self.sio.on('update_settings', self._count('update_settings'))
+        self.sio.on('printer_status', self._count('printer_status'))
+        self.sio.on('client_ping', self._on_ping)
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def send_jobs(self, count: int, rate: float, payload: str, auto_cut: bool):
+        start = time.perf_counter()
+        for i in range(count):
+            # Schedule against the start time so slow emits don't lower the rate
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            job_id = f'bench-{i}'
+            image = i % len(self.images)
+            job = {'job_id': job_id, 'auto_cut': auto_cut}
+            if payload == 'url':
+                job['file_url'] = f'http://127.0.0.1:{self.files_port}/img/{image}.{self.ext}'
+            elif payload == 'base64':
+                job['content'] = base64.b64encode(self.images[image]).decode()
+            else:
+                job['content'] = self.images[image]
+            self.sent_at[job_id] = time.perf_counter()
+            await self.sio.emit('print_job', job, to=self.linked_sid)
+            if i == count // 2:
+                await self.sio.emit('token_rotated', {'token': BENCH_TOKEN}, to=self.linked_sid)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        app = web.Application()
+        self.sio.attach(app)
+        app.router.add_get('/api/version', self._version)
+        files = web.Application()
+        files.router.add_get('/img/{name}', self._image)
+
+        runners = [web.AppRunner(app), web.AppRunner(files)]
+        for runner, port in zip(runners, (self.port, self.files_port)):
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', port).start()
+        self.ready.set()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    async def _version(self, request):
+        return web.json_response({'latest_version': '0.0.0', 'download_url': '', 'github_url': ''})
+
+    async def _image(self, request):
+        index = int(request.match_info['name'].split('.')[0])
+        return web.Response(body=self.images[index], content_type=f'image/{self.ext}')
+
+    async def _on_connect(self, sid, environ, auth):
+        auth = auth or {}
+        if auth.get('token') != BENCH_TOKEN:
+            await self.sio.emit('welcome', {'code': 'BENCH', 'linked': False}, to=sid)
+            await self.sio.emit('token_issued', {'token': BENCH_TOKEN}, to=sid)
+            return
+        await self.sio.emit('welcome', {'code': 'BENCH', 'linked': True}, to=sid)
+        self.linked_sid = sid
+        self.linked.set()
+
+    async def _on_disconnect(self, sid, *args):
+        if sid == self.linked_sid:
+            self.linked_sid = None
+            self.linked.clear()
+
+    async def _on_job_update(self, sid, data):
+        job_id = data.get('job_id')
+        if job_id not in self.sent_at or job_id in self.done_at:
+            return
+        self.done_at[job_id] = time.perf_counter()
+        self.updates[job_id] = data
+        if len(self.done_at) == self.expected:
+            self.all_done.set()
+
+    async def _on_ping(self, sid, data=None):
+        return True
+
+    def _count(self, event: str):
+        async def handler(sid, data=None):
+            self.events[event] = self.events.get(event, 0) + 1
+        return handler
+
+
+class LagMonitor:
+    """Measures how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+
+def _simulator_stats(worker) -> Optional[Dict[str, Any]]:
+    printer = worker.get_printer().printer
+    return {'name': worker.name, **printer.stats()} if hasattr(printer, 'stats') else None
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def run_client(conn) -> Dict[str, Any]:
+    """
+    Receiver side of a run: connect, say when ready, and once told the run
+    is over, report what only the receiver process can measure.
+    """
+    # Imported only now: these read config.json from the working directory
+    from .client import printer_client
+    from .jobs import print_queue
+    from .status_monitor import status_monitor
+
+    loop = asyncio.get_running_loop()
+    lag = LagMonitor()
+    lag.start()
+    await status_monitor.start()
+    await printer_client.connect()
+
+    # The first connection is unlinked; the relay says once the client has reconnected with its token
+    await loop.run_in_executor(None, conn.recv)
+    version = await printer_client.check_for_updates()
+    lag.samples.clear()
+    conn.send('ready')
+
+    await loop.run_in_executor(None, conn.recv)
+    lag.stop()
+    simulators = await asyncio.gather(*(worker.run(_simulator_stats, worker) for worker in print_queue.workers))
+    result = {
+        'loop_lag_ms': summarize(lag.samples),
+        'peak_rss_mb': peak_rss_mb(),
+        'queue': print_queue.stats(),
+        'version_check': bool(version.get('current_version')),
+        'simulators': [stats for stats in simulators if stats is not None],
+    }
+
+    await printer_client.disconnect()
+    await status_monitor.stop()
+    return result
+
+
+def receiver_main(workdir: str, conn, verbose: bool):
+    """
+    Receiver process. The client and its printers run apart from the relay
+    stand-in and the generated images, so peak RSS is the receiver's own.
+    """
+    _setup_logging(verbose)
+    os.chdir(workdir)
+    # The client prints progress to stdout; keep stdout for the result
+    with contextlib.redirect_stdout(sys.stderr):
+        conn.send(asyncio.run(run_client(conn)))
+
+
+def run_bench(args, relay: Relay, conn) -> Dict[str, Any]:
+    if not relay.linked.wait(10):
+        raise RuntimeError("Client never connected to the relay stand-in")
+    conn.send('linked')
+    conn.recv()
+
+    relay.expected = args.jobs
+    start = time.perf_counter()
+    asyncio.run_coroutine_threadsafe(
+        relay.send_jobs(args.jobs, args.rate, args.payload, not args.no_cut), relay.loop).result()
+    finished = relay.all_done.wait(args.timeout)
+    duration = (max(relay.done_at.values()) if relay.done_at else time.perf_counter()) - start
+    conn.send('done')
+    receiver = conn.recv()
+
+    latencies = [relay.done_at[job_id] - sent for job_id, sent in relay.sent_at.items() if job_id in relay.done_at]
+    statuses: Dict[str, int] = {}
+    for update in relay.updates.values():
+        key = update['status'] if update['status'] == 'completed' else f"failed:{update.get('reason')}"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    return {
+        'jobs': {
+            'sent': len(relay.sent_at),
+            'answered': len(relay.done_at),
+            'lost': len(relay.sent_at) - len(relay.done_at),
+            'statuses': statuses,
+            'timed_out': not finished,
+        },
+        'duration_s': round(duration, 3),
+        'jobs_per_sec': round(len(relay.done_at) / duration, 2) if duration > 0 else 0.0,
+        'latency_ms': summarize(latencies),
+        'loop_lag_ms': receiver['loop_lag_ms'],
+        'peak_rss_mb': receiver['peak_rss_mb'],
+        'queue': receiver['queue'],
+        'relay_events': relay.events,
+        'version_check': receiver['version_check'],
+        'simulators': receiver['simulators'],
+    }
+
+
+def _setup_logging(verbose: bool):
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PrintsAlot end-to-end load generator')
+    parser.add_argument('--jobs', type=int, default=100, help='Number of print jobs to send')
+    parser.add_argument('--rate', type=float, default=10.0, help='Jobs sent per second')
+    parser.add_argument('--payload', choices=('url', 'base64', 'binary'), default='url')
+    parser.add_argument('--size', default='800x1200', help='Source image size, WxH')
+    parser.add_argument('--format', choices=('png', 'jpeg'), default='jpeg')
+    parser.add_argument('--images', type=int, default=20, help='Distinct images to cycle through')
+    parser.add_argument('--serializer', choices=('default', 'msgpack'), default='default')
+    parser.add_argument('--printers', type=int, default=1, help='Simulated printers in the pool')
+    parser.add_argument('--realtime', action='store_true', help='Simulated printers take real time')
+    parser.add_argument('--no-cut', action='store_true', help='Send jobs with auto_cut off')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for the last job_update')
+    parser.add_argument('--output', help='Write the JSON result here instead of stdout')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    _setup_logging(args.verbose)
+
+    port, files_port = _free_port(), _free_port()
+    workdir = tempfile.mkdtemp(prefix='printsalot-bench-')
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump({
+            'token': None,
+            'relay_url': f'http://127.0.0.1:{port}',
+            'printer_settings': {'width': 384, 'dither': 'floyd', 'max_px_height': 2000},
+            'printers': [{'name': f'sim{i + 1}', 'type': 'simulated', 'realtime': args.realtime}
+                         for i in range(args.printers)],
+            'queue': {'max_depth': max(args.jobs, 20)},
+            'socketio': {'serializer': args.serializer},
+        }, f)
+    os.environ.pop('RELAY_URL', None)
+
+    relay = Relay(port, files_port, make_images(args.images, args.size, args.format), args.format, args.serializer)
+    threading.Thread(target=relay.run, name='relay', daemon=True).start()
+    relay.ready.wait()
+
+    # Spawned rather than forked, so the receiver doesn't start out holding this process's memory
+    context = multiprocessing.get_context('spawn')
+    conn, receiver_conn = context.Pipe()
+    receiver = context.Process(target=receiver_main, args=(workdir, receiver_conn, args.verbose), name='receiver')
+    receiver.start()
+    try:
+        result = run_bench(args, relay, conn)
+    finally:
+        receiver.join(timeout=10)
+        if receiver.is_alive():
+            receiver.terminate()
+    result['config'] = vars(args)
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
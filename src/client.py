@@ -2,23 +2,54 @@ import socketio
 import asyncio
 import aiohttp
 import logging
-from typing import Optional, Callable
+import time
+from collections import deque
+from typing import Any, Optional, Callable
+from . import metrics
 from .config_manager import config_manager
+from .startup import startup_profile
+from .job_ledger import job_ledger
+from .jobs import PrintJob, print_queue
+from .journal import job_journal
+from .status_monitor import status_monitor
 
 # Current client version
 CLIENT_VERSION = "2.0.3"
 
 logger = logging.getLogger('PrintsAlot.client')
 
+# Events kept while disconnected, flushed on reconnect
+DEFAULT_OUTBOX_SIZE = 500
+
+# Acknowledged pings for the RTT metric, off unless the relay answers the event
+# with an ack. Engine.IO pings come from the server, so the client can't time them.
+DEFAULT_PING_EVENT = 'client_ping'
+DEFAULT_PING_INTERVAL = 0
+PING_TIMEOUT = 5
+# Unanswered pings back off, doubling up to this many seconds between tries
+MAX_PING_BACKOFF = 600
+
 class PrinterClient:
     def __init__(self):
-        self.sio = socketio.AsyncClient()
+        self.serializer = self._select_serializer()
+        self.sio = socketio.AsyncClient(serializer=self.serializer)
         self.connected = False
         self.callbacks = {}
         self._should_reconnect = True
         self._reconnect_task = None
         self._reconnect_delay = 1  # Start with 1 second
         self._max_reconnect_delay = 30  # Max 30 seconds between attempts
+        self._connected_before = False
+        self._ping_task = None
+
+        # Emits made while disconnected, oldest first; starts with outcomes from before a restart
+        self._outbox: deque = deque()
+        socketio_settings = config_manager.get('socketio', {})
+        self._outbox_size = socketio_settings.get('outbox_size', DEFAULT_OUTBOX_SIZE)
+        self._ping_event = socketio_settings.get('ping_event', DEFAULT_PING_EVENT)
+        self._ping_interval = socketio_settings.get('ping_interval', DEFAULT_PING_INTERVAL)
+        for update in job_journal.unreported():
+            self._outbox.append(('job_update', self._job_update(update['job_id'], update['status'], update['reason'])))
         
         # Register events
         self.sio.on('connect', self._on_connect)
@@ -27,10 +58,26 @@ class PrinterClient:
         self.sio.on('token_issued', self._on_token_issued)
         self.sio.on('token_rotated', self._on_token_rotated)
         self.sio.on('welcome', self._on_welcome)
+        print_queue.on_complete(self._on_job_done)
+        status_monitor.on_change(self._on_printer_status)
+        config_manager.subscribe(('printer_settings',), self._on_settings_changed)
+        config_manager.subscribe(('relay_url', 'token'), self._on_connection_changed)
         
         self.pairing_code = None
         self.is_linked = False
 
+    @staticmethod
+    def _select_serializer() -> str:
+        """Use msgpack packets if configured and available, otherwise the default JSON + binary attachments."""
+        serializer = config_manager.get('socketio', {}).get('serializer', 'default')
+        if serializer == 'msgpack':
+            try:
+                import msgpack  # noqa: F401
+            except ImportError:
+                logger.warning("msgpack serializer requested but msgpack is not installed, using default")
+                return 'default'
+        return serializer
+
     async def _on_welcome(self, data):
         print(f"Welcome: {data}")
         self.pairing_code = data.get('code')
@@ -66,6 +113,11 @@ class PrinterClient:
             'max_attachments': settings.get('max_attachments', 1),
             'auto_cut': settings.get('auto_cut', True)
         })
+        # Let the relay send print_job content as raw bytes instead of base64
+        auth.update({
+            'accepts_binary': True,
+            'serializer': self.serializer
+        })
             
         try:
             # Force websocket transport to avoid polling issues
@@ -85,6 +137,15 @@ class PrinterClient:
         self.connected = True
         self._reconnect_delay = 1  # Reset delay on successful connection
         print("Connected to Relay")
+        startup_profile.mark('socket_connect')
+        if self._connected_before:
+            metrics.reconnects.inc()
+        self._connected_before = True
+        if self._ping_interval and (self._ping_task is None or self._ping_task.done()):
+            self._ping_task = asyncio.create_task(self._ping_loop())
+        await self._flush_outbox()
+        if status_monitor.status is not None:
+            await self.sio.emit('printer_status', status_monitor.status)
         if self.callbacks.get('connect'):
             self.callbacks['connect']()
 
@@ -98,6 +159,29 @@ class PrinterClient:
         if self._should_reconnect:
             self._schedule_reconnect()
     
+    async def _ping_loop(self):
+        """
+        Time an acknowledged event every ping_interval while connected, for
+        the RTT metric. While the relay doesn't answer, the wait doubles.
+        """
+        delay = self._ping_interval
+        while self.connected:
+            await asyncio.sleep(delay)
+            if not self.connected:
+                break
+            start = time.perf_counter()
+            try:
+                await self.sio.call(self._ping_event, timeout=PING_TIMEOUT)
+            except socketio.exceptions.TimeoutError:
+                delay = min(delay * 2, max(MAX_PING_BACKOFF, self._ping_interval))
+                logger.info(f"Relay didn't acknowledge {self._ping_event}, retrying in {delay}s")
+                continue
+            except Exception as e:
+                logger.debug(f"Ping failed: {e}")
+                continue
+            delay = self._ping_interval
+            metrics.ping_rtt.observe(time.perf_counter() - start)
+
     def _schedule_reconnect(self):
         """Schedule a reconnection attempt with exponential backoff."""
         if self._reconnect_task and not self._reconnect_task.done():
@@ -125,62 +209,74 @@ class PrinterClient:
         self._reconnect_task = asyncio.create_task(reconnect_loop())
 
     async def _on_print_job(self, data):
-        logger.info(f"Received print job: {data}")
         job_id = data.get('job_id')
-        try:
-            from .printer import printer_wrapper, PaperError
-        except Exception as import_error:
-            logger.error(f"Failed to import printer module: {import_error}", exc_info=True)
-            if job_id:
-                await self.sio.emit('job_update', {
-                    'job_id': job_id,
-                    'status': 'failed',
-                    'reason': 'error'
-                })
+        content = data.get('content') or data.get('file_url')
+        auto_cut = data.get('auto_cut', True)
+        metrics.jobs_received.inc()
+
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            logger.info(f"Received print job {job_id}: {len(content)} bytes of binary content, auto_cut: {auto_cut}")
+        elif isinstance(content, str) and not content.startswith('http'):
+            logger.info(f"Received print job {job_id}: {len(content)} chars of base64 content, auto_cut: {auto_cut}")
+        else:
+            logger.info(f"Received print job {job_id}: {content}, auto_cut: {auto_cut}")
+        # Only the other fields: formatting the image payload would cost more than the job's own handling
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Print job %s fields: %s", job_id,
+                         {key: value for key, value in data.items() if key not in ('content', 'file_url')})
+
+        if not content:
+            logger.warning(f"Job {job_id} has no content, nothing to print")
+            if self.callbacks.get('print_job'):
+                self.callbacks['print_job'](data)
             return
-        
-        try:
-            content = data.get('content') or data.get('file_url')
-            auto_cut = data.get('auto_cut', True)
-            
-            logger.info(f"Processing job {job_id}, content: {content}, auto_cut: {auto_cut}")
-            
-            if content:
-                # Run in executor to avoid blocking async loop
-                logger.info("Sending to printer...")
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(
-                    None, printer_wrapper.print_image, content, auto_cut
-                )
-                logger.info("Print completed successfully")
-                
-                # Success
-                if job_id:
-                    logger.info(f"Sending job_update completed for {job_id}")
-                    await self.sio.emit('job_update', {
-                        'job_id': job_id,
-                        'status': 'completed'
-                    })
-
-        except PaperError as e:
-            logger.error(f"Paper error: {e}")
-            if job_id:
-                await self.sio.emit('job_update', {
-                    'job_id': job_id,
-                    'status': 'failed',
-                    'reason': 'out_of_paper'
-                })
-        except Exception as e:
-            logger.error(f"Printing failed: {e}", exc_info=True)
+
+        # The relay may resend jobs after a reconnect: acknowledge, don't reprint
+        if job_id:
+            if print_queue.has_job(job_id):
+                logger.info(f"Job {job_id} is already queued, ignoring resend")
+                return
+            recorded = job_ledger.get(job_id)
+            if recorded:
+                logger.info(f"Job {job_id} already {recorded['status']}, acknowledging resend")
+                await self._emit('job_update', self._job_update(job_id, recorded['status'], recorded['reason']))
+                return
+
+        # Hand off to the print queue; the printer thread reports back via _on_job_done
+        job = PrintJob(job_id, content, auto_cut, data)
+        if not print_queue.submit(job):
+            metrics.jobs_failed.inc(reason='queue_full')
             if job_id:
-                await self.sio.emit('job_update', {
-                    'job_id': job_id,
-                    'status': 'failed',
-                    'reason': 'error'
-                })
-            
+                await self._emit('job_update', self._job_update(job_id, 'failed', 'queue_full'))
+
+    async def _on_job_done(self, job: PrintJob, status: str, reason: Optional[str] = None):
+        if job.job_id:
+            job_ledger.record(job.job_id, status, reason)
+            logger.info(f"Sending job_update {status} for {job.job_id}")
+            update = self._job_update(job.job_id, status, reason)
+            # Stage timings in ms, for latency dashboards on the relay
+            update['timings'] = job.timings_ms()
+            await self._emit('job_update', update)
+
         if self.callbacks.get('print_job'):
-            self.callbacks['print_job'](data)
+            self.callbacks['print_job'](job.data)
+
+    @staticmethod
+    def _job_update(job_id: str, status: str, reason: Optional[str] = None) -> dict:
+        update = {
+            'job_id': job_id,
+            'status': status
+        }
+        if reason:
+            update['reason'] = reason
+        return update
+
+    async def _on_printer_status(self, status: dict):
+        # Lets the relay stop routing jobs here while out of paper or offline
+        if self.connected:
+            await self.sio.emit('printer_status', status)
+        if self.callbacks.get('printer_status'):
+            self.callbacks['printer_status'](status)
 
     async def _on_token_issued(self, data):
         print(f"Token issued: {data}")
@@ -206,8 +302,70 @@ class PrinterClient:
         self.callbacks[event] = callback
 
     async def update_settings(self, settings):
+        await self._emit('update_settings', settings)
+
+    async def reconnect(self):
+        """
+        Connect again with the current relay_url and token. Jobs carry on
+        printing; their updates wait in the outbox until the new connection.
+        """
+        if self.sio.connected:
+            await self.sio.disconnect()
+        await self.connect()
+
+    async def _on_settings_changed(self, changed):
+        # Edited outside the web UI: tell the relay, as saving them in the UI does
+        await self.update_settings(config_manager.get('printer_settings', {}))
+
+    async def _on_connection_changed(self, changed):
+        if self._should_reconnect:
+            logger.info(f"{' and '.join(sorted(changed & {'relay_url', 'token'}))} changed, reconnecting to the relay")
+            await self.reconnect()
+
+    async def _emit(self, event: str, data: Any):
+        """Emit now if connected, otherwise keep the event until the next connect."""
         if self.connected:
-            await self.sio.emit('update_settings', settings)
+            try:
+                await self.sio.emit(event, data)
+                self._on_sent(event, data)
+                return
+            except Exception as e:
+                logger.warning(f"Emitting {event} failed, will retry on reconnect: {e}")
+        self._buffer(event, data)
+
+    def _buffer(self, event: str, data: Any):
+        if event == 'update_settings':
+            # Only the latest settings matter
+            self._outbox = deque(item for item in self._outbox if item[0] != 'update_settings')
+        if len(self._outbox) >= self._outbox_size:
+            dropped, _ = self._outbox.popleft()
+            logger.warning(f"Outbound buffer full ({self._outbox_size}), dropped oldest {dropped}")
+        self._outbox.append((event, data))
+        logger.info(f"Not connected, queued {event} ({len(self._outbox)} pending)")
+
+    async def _flush_outbox(self):
+        """
+        Send buffered events in order. Emits only queue packets on the
+        Engine.IO transport, which writes whatever is queued together, so
+        a backlog goes out as a batch rather than a round trip per event.
+        """
+        if not self._outbox:
+            return
+        logger.info(f"Flushing {len(self._outbox)} buffered events")
+        while self._outbox and self.connected:
+            event, data = self._outbox[0]
+            try:
+                await self.sio.emit(event, data)
+            except Exception as e:
+                logger.warning(f"Flushing {event} failed, keeping {len(self._outbox)} events: {e}")
+                return
+            self._outbox.popleft()
+            self._on_sent(event, data)
+
+    @staticmethod
+    def _on_sent(event: str, data: Any):
+        if event == 'job_update':
+            job_journal.reported(data['job_id'])
     
     async def check_for_updates(self) -> dict:
         """
@@ -261,3 +419,5 @@ class PrinterClient:
             return False
 
 printer_client = PrinterClient()
+metrics.collected('printsalot_socketio_connected', 'Whether the relay connection is up.',
+                  lambda: int(printer_client.connected))
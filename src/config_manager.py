@@ -1,24 +1,158 @@
+import atexit
 import json
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+logger = logging.getLogger('PrintsAlot.config')
+
+# Changes are written once they stop coming for SAVE_DELAY seconds,
+# but never later than MAX_SAVE_DELAY after the first unsaved change
+SAVE_DELAY = 0.5
+MAX_SAVE_DELAY = 2.0
+SAVE_RETRY_DELAY = 5.0
+FLUSH_TIMEOUT = 5.0
+
+# Fallbacks for printer_settings keys missing from config.json
+PRINTER_SETTING_DEFAULTS = {
+    "width": 384,
+    "dither": "floyd",
+    "max_px_height": 2000,
+    "auto_cut": True,
+}
+
+DITHER_MODES = ('floyd', 'bayer', 'threshold')
+MAX_WIDTH = 800
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_config(config: Any) -> List[str]:
+    """Problems that would stop a config being used, for a reloaded config.json."""
+    if not isinstance(config, dict):
+        return ["config must be a JSON object"]
+    problems = []
+    token = config.get('token')
+    if token is not None and not isinstance(token, str):
+        problems.append("token must be a string or null")
+    relay_url = config.get('relay_url')
+    if relay_url is not None and not (isinstance(relay_url, str) and relay_url.startswith(('http://', 'https://'))):
+        problems.append("relay_url must be an http(s) URL")
+
+    settings = config.get('printer_settings', {})
+    if not isinstance(settings, dict):
+        problems.append("printer_settings must be an object")
+        settings = {}
+    width = settings.get('width', PRINTER_SETTING_DEFAULTS['width'])
+    if not _is_int(width) or not 0 < width <= MAX_WIDTH:
+        problems.append(f"printer_settings.width must be a whole number from 1 to {MAX_WIDTH}")
+    max_px_height = settings.get('max_px_height', PRINTER_SETTING_DEFAULTS['max_px_height'])
+    if not _is_int(max_px_height) or max_px_height <= 0:
+        problems.append("printer_settings.max_px_height must be a positive whole number")
+    if settings.get('dither', PRINTER_SETTING_DEFAULTS['dither']) not in DITHER_MODES:
+        problems.append(f"printer_settings.dither must be one of {', '.join(DITHER_MODES)}")
+    if not isinstance(settings.get('auto_cut', True), bool):
+        problems.append("printer_settings.auto_cut must be true or false")
+
+    printers = config.get('printers')
+    if printers is not None:
+        if not isinstance(printers, list) or not all(isinstance(device, dict) for device in printers):
+            problems.append("printers must be a list of objects")
+        else:
+            names = [device['name'] for device in printers if 'name' in device]
+            if len(names) != len(set(names)):
+                problems.append("printers must have unique names")
+    return problems
+
+def _write_atomic(path: str, data: str):
+    """Replace a file so that readers, and a crash, see either the old or the new contents."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable; Windows has no directory handles for this
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
-load_dotenv()
 
 class ConfigManager:
+    """
+    The in-memory config is the source of truth. Changes are written
+    behind, debounced, by a background thread: atomically to config.json,
+    then to config.json.bak as the last known good copy, which is used
+    if config.json is ever unreadable.
+    """
+
     def __init__(self, filename: str = "config.json"):
         self.filename = filename
+        self.backup_filename = f"{filename}.bak"
+        # Directory holding config.json; other local state (caches etc.) lives next to it
+        self.directory = os.path.dirname(os.path.abspath(filename))
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._first_change: Optional[float] = None  # None when everything is saved
+        self._last_change = 0.0
+        self._writing = False
+        self._flushing = False
+        self._writer: Optional[threading.Thread] = None
+        self._disk_stat: Optional[Tuple[int, int]] = None  # config.json as last read or written
+        self._subscribers: List[Tuple[frozenset, Callable[[Set[str]], Any]]] = []
+        self._env_loaded = False
+
         self.config: Dict[str, Any] = self._load_config()
 
     def _load_config(self) -> Dict[str, Any]:
-        if not os.path.exists(self.filename):
+        if not os.path.exists(self.filename) and not os.path.exists(self.backup_filename):
             return self._create_default_config()
         try:
-            with open(self.filename, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
+            self._disk_stat = self._stat()
+            config = self._read(self.filename)
+            if not os.path.exists(self.backup_filename):
+                self.save_config(config)
+            return config
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.filename}: {e}")
+
+        try:
+            config = self._read(self.backup_filename)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.backup_filename} either, starting from defaults: {e}")
+            self._set_aside(self.filename)
             return self._create_default_config()
+        logger.warning(f"Restored config from {self.backup_filename}")
+        self._set_aside(self.filename)
+        self.save_config(config)
+        return config
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, Any]:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("not a JSON object")
+        return config
+
+    @staticmethod
+    def _set_aside(path: str):
+        """Keep an unreadable config for inspection rather than overwriting it."""
+        if os.path.exists(path):
+            corrupt = f"{path}.corrupt"
+            try:
+                os.replace(path, corrupt)
+                logger.warning(f"Moved unreadable {path} to {corrupt}")
+            except OSError as e:
+                logger.error(f"Could not move {path} aside: {e}")
 
     def _create_default_config(self) -> Dict[str, Any]:
         default_config = {
@@ -33,21 +167,148 @@ class ConfigManager:
         return default_config
 
     def save_config(self, config: Optional[Dict[str, Any]] = None):
-        if config:
-            self.config = config
-        with open(self.filename, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        """Schedule the config to be written. Returns without waiting for the disk."""
+        with self._changed:
+            if config:
+                self.config = config
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name='config-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            self._changed.notify_all()
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Write pending changes now and wait for them. Returns False if that timed out."""
+        with self._changed:
+            if self._writer is None:
+                return True
+            self._flushing = True
+            self._changed.notify_all()
+            try:
+                return self._changed.wait_for(lambda: self._first_change is None and not self._writing, timeout)
+            finally:
+                self._flushing = False
+
+    def _run_writer(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._first_change is not None)
+                while not self._flushing:
+                    deadline = min(self._last_change + SAVE_DELAY, self._first_change + MAX_SAVE_DELAY)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                data = json.dumps(self.config, indent=4)
+                self._first_change = None
+                self._writing = True
+
+            try:
+                _write_atomic(self.filename, data)
+                stat = self._stat()
+                _write_atomic(self.backup_filename, data)
+                failed = False
+            except OSError as e:
+                logger.error(f"Saving {self.filename} failed, will retry: {e}")
+                failed = True
+
+            with self._changed:
+                self._writing = False
+                if not failed:
+                    self._disk_stat = stat
+                if failed and self._first_change is None:
+                    self._first_change = self._last_change = time.monotonic()
+                self._changed.notify_all()
+            if failed:
+                time.sleep(SAVE_RETRY_DELAY)
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def subscribe(self, keys: Iterable[str], callback: Callable[[Set[str]], Any]):
+        """
+        Have callback(changed_keys) called when a reload of config.json
+        changes any of these top-level keys. Coroutine callbacks are awaited.
+        """
+        self._subscribers.append((frozenset(keys), callback))
+
+    def subscribers(self, changed: Set[str]) -> List[Callable[[Set[str]], Any]]:
+        return [callback for keys, callback in self._subscribers if keys & changed]
+
+    def subscribed_keys(self) -> Set[str]:
+        return set().union(*(keys for keys, _ in self._subscribers))
+
+    def changed_on_disk(self) -> bool:
+        """Whether config.json was changed by something other than this process."""
+        with self._lock:
+            if self._first_change is not None or self._writing:
+                return False  # about to be overwritten with what's in memory anyway
+            stat = self._stat()
+            return stat is not None and stat != self._disk_stat
+
+    def reload(self) -> Set[str]:
+        """
+        Re-read config.json after an outside change. A config that fails
+        to parse or validate is logged and ignored until the file changes
+        again. Returns the top-level keys whose values changed.
+        """
+        stat = self._stat()
+        try:
+            config = self._read(self.filename)
+        except (OSError, ValueError) as e:
+            problems = [str(e)]
+        else:
+            problems = validate_config(config)
+        if problems:
+            with self._lock:
+                self._disk_stat = stat
+            logger.error(f"Ignoring changed {self.filename}: {'; '.join(problems)}")
+            return set()
+
+        with self._lock:
+            if self._first_change is not None or self._writing:
+                return set()  # changed in memory meanwhile; that write wins
+            old, self.config = self.config, config
+            self._disk_stat = stat
+        changed = {key for key in old.keys() | config.keys() if old.get(key) != config.get(key)}
+        if changed:
+            logger.info(f"Reloaded {self.filename}, changed: {', '.join(sorted(changed))}")
+            try:
+                _write_atomic(self.backup_filename, json.dumps(config, indent=4))
+            except OSError as e:
+                logger.warning(f"Could not update {self.backup_filename}: {e}")
+        return changed
 
     def get(self, key: str, default: Any = None) -> Any:
         # Prefer env var for relay_url
         if key == 'relay_url':
-            env_url = os.getenv('RELAY_URL')
+            env_url = self._env('RELAY_URL')
             if env_url:
                 return env_url
         return self.config.get(key, default)
 
+    def _env(self, name: str) -> Optional[str]:
+        """An environment variable, reading .env the first time one is needed."""
+        if not self._env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            self._env_loaded = True
+        return os.getenv(name)
+
+    def printer_setting(self, key: str) -> Any:
+        return self.config.get('printer_settings', {}).get(key, PRINTER_SETTING_DEFAULTS.get(key))
+
     def set(self, key: str, value: Any):
-        self.config[key] = value
+        with self._lock:
+            self.config[key] = value
         self.save_config()
 
 config_manager = ConfigManager()
@@ -0,0 +1,63 @@
+"""
+Config file watcher for PrintsAlot.
+Polls config.json's modification time and size, and when it is changed
+by hand or by other tools, reloads it and notifies the components
+subscribed to the keys that changed.
+"""
+import asyncio
+import inspect
+import logging
+from typing import Optional, Set
+
+from .config_manager import config_manager
+
+logger = logging.getLogger('PrintsAlot.config')
+
+DEFAULT_INTERVAL = 2
+
+
+class ConfigWatcher:
+    def __init__(self):
+        settings = config_manager.get('config_watch', {})
+        self.enabled = settings.get('enabled', True)
+        self.interval = settings.get('interval', DEFAULT_INTERVAL)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if config_manager.changed_on_disk():
+                    # Reading, validating and updating the backup touch the disk
+                    changed = await asyncio.to_thread(config_manager.reload)
+                    if changed:
+                        await self.notify(changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Config reload failed: {e}", exc_info=True)
+
+    @staticmethod
+    async def notify(changed: Set[str]):
+        unhandled = changed - config_manager.subscribed_keys()
+        if unhandled:
+            logger.info(f"Changes to {', '.join(sorted(unhandled))} take effect after a restart")
+        callbacks = config_manager.subscribers(changed)
+        for callback in callbacks:
+            try:
+                result = callback(changed)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Applying config change to {callback} failed: {e}", exc_info=True)
+
+
+config_watcher = ConfigWatcher()
@@ -0,0 +1,133 @@
+"""
+Incremental image decoding for PrintsAlot.
+Decodes downloads chunk by chunk as they arrive, at reduced resolution
+where the format allows it, and rejects oversized images from the header.
+"""
+import io
+import logging
+from typing import List
+
+from PIL import Image, ImageFile, UnidentifiedImageError
+
+logger = logging.getLogger('PrintsAlot.decoder')
+
+# Decoded pixels allowed per printable pixel (width x max_px_height)
+DEFAULT_PIXEL_BUDGET_FACTOR = 16
+
+# Bytes to receive before giving up on finding an image header. Every chunk
+# re-parses what came before, so this bounds that work; it leaves room for
+# JPEG EXIF and ICC segments, which come before the frame header.
+MAX_HEADER_BYTES = 256 * 1024
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+def pixel_budget() -> int:
+    """Largest image, in decoded pixels, we agree to decode under the current printer settings."""
+    # Imported here so render pool workers, which only decode, don't load the config
+    from .config_manager import config_manager
+    factor = config_manager.get('fetch', {}).get('pixel_budget_factor', DEFAULT_PIXEL_BUDGET_FACTOR)
+    return int(config_manager.printer_setting('width') * config_manager.printer_setting('max_px_height') * factor)
+
+
+def prepare_decode(img: Image.Image, width: int, max_pixels: int):
+    """
+    Set up a freshly opened image for decoding close to the printer width
+    (JPEG DCT scaling via draft()), then enforce the pixel budget.
+    Raises ImageTooLargeError before any pixel data is decoded.
+    """
+    source_size = img.size
+    if img.width > width:
+        # Only affects formats with draft support (JPEG); a no-op otherwise
+        img.draft('L', (width, max(1, round(img.height * width / img.width))))
+    if img.width * img.height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image {source_size[0]}x{source_size[1]} exceeds the decode budget of {max_pixels} pixels"
+        )
+
+
+class StreamDecoder(ImageFile.Parser):
+    """
+    ImageFile.Parser that applies prepare_decode() as soon as the header
+    has arrived, before its decoder is created. Formats that can't be
+    decoded incrementally (e.g. PNG) are buffered and decoded on close().
+    With header_only, feeding stops mattering once the header is checked.
+    Setting up the incremental decoder uses Pillow internals; if they
+    change, the download is buffered and decoded on close() instead.
+    """
+
+    def __init__(self, width: int, max_pixels: int, header_only: bool = False):
+        self.width = width
+        self.max_pixels = max_pixels
+        self.header_only = header_only
+        self._header = bytearray()  # data received before the header could be parsed
+        self._chunks: List[bytes] = []  # buffered download, joined once in close()
+
+    def feed(self, data: bytes):
+        if self.image is not None or self.finished:
+            if self.header_only:
+                return
+            if self.decoder is None:
+                # Parser.feed would copy the whole buffer on every chunk
+                self._chunks.append(bytes(data))
+                return
+            return super().feed(data)
+
+        # Header stage: mirrors Parser.feed, with prepare_decode() before the decoder is set up
+        self._header += data
+        try:
+            with io.BytesIO(self._header) as fp:
+                im = Image.open(fp)
+        except OSError:
+            if len(self._header) > MAX_HEADER_BYTES:
+                raise UnidentifiedImageError(f"No image header in the first {len(self._header)} bytes")
+            return  # not enough data yet
+        prepare_decode(im, self.width, self.max_pixels)
+        received, self._header = bytes(self._header), bytearray()
+        self.image = im
+        if self.header_only:
+            return
+
+        # JPEG's load_read only pads truncated files, so its decoder can still be fed incrementally
+        incremental = im.format == 'JPEG' or not (hasattr(im, 'load_seek') or hasattr(im, 'load_read'))
+        if incremental and len(im.tile) == 1:
+            self._start_decoder(im)
+        if self.decoder is None:
+            self._chunks.append(received)
+            return
+
+        # Decode whatever arrived along with the header
+        self.data = received
+        if self.offset <= len(self.data):
+            self.data = self.data[self.offset:]
+            self.offset = 0
+        if self.data:
+            super().feed(b'')
+
+    def _start_decoder(self, im: Image.Image):
+        try:
+            im.load_prepare()
+            decoder_name, extents, offset, args = im.tile[0]
+            decoder = Image._getdecoder(im.mode, decoder_name, args, im.decoderconfig)
+            decoder.setimage(im.im, extents)
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.debug(f"Incremental decoding unavailable, buffering instead: {e}")
+            return
+        im.tile = []
+        self.decoder = decoder
+        self.offset = offset
+
+    def close(self) -> Image.Image:
+        if self.decoder or self.image is None or not self._chunks:
+            return super().close()
+
+        # Incremental decoding wasn't possible: decode the buffered file, still at reduced size
+        data, self._chunks = b''.join(self._chunks), []
+        with io.BytesIO(data) as fp:
+            im = Image.open(fp)
+            prepare_decode(im, self.width, self.max_pixels)
+            im.load()
+        self.image = im
+        return im
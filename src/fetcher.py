@@ -0,0 +1,192 @@
+"""
+Image fetching for PrintsAlot.
+Downloads print job images on the event loop over one pooled, keep-alive
+HTTP session, decoding them on a background thread as chunks arrive, so
+the printer thread only ever sees decoded images or bytes.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from .config_manager import config_manager
+from .timing import add_time, timed
+
+logger = logging.getLogger('PrintsAlot.fetcher')
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_MAX_MB = 20
+DEFAULT_LIMIT_PER_HOST = 4
+DEFAULT_KEEPALIVE = 30
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(Exception):
+    pass
+
+
+class ImageSource:
+    """
+    What the printer thread receives for a job: raw image bytes, an image
+    already decoded during download, a raster rendered ahead of time, or
+    only the key of a cached raster.
+    `digest` identifies the source bytes for the raster cache; `timings`
+    holds the time spent fetching and decoding it.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, image: Any = None, digest: Optional[str] = None,
+                 cache_key: Optional[str] = None, url: Optional[str] = None,
+                 timings: Optional[Dict[str, float]] = None, raster: Optional[bytes] = None):
+        self.data = data
+        self.image = image
+        self.digest = digest
+        self.cache_key = cache_key
+        self.url = url
+        self.timings = timings or {}
+        self.raster = raster
+
+
+def decode_base64(content: str) -> bytes:
+    """Decode a Base64 image, with or without a data-URL header."""
+    # Remove header if present
+    if ',' in content:
+        content = content.split(',', 1)[1]
+    try:
+        return base64.b64decode(content)
+    except (binascii.Error, ValueError) as e:
+        raise FetchError(f"Failed to decode base64: {e}") from e
+
+
+def as_image_bytes(content) -> bytes:
+    """
+    Wrap a binary payload for decoding without copying it where possible.
+    `bytes` is returned as-is, since io.BytesIO shares its buffer.
+    """
+    if isinstance(content, bytes):
+        return content
+    view = memoryview(content)
+    return view.cast('B') if view.format != 'B' or view.ndim != 1 else view
+
+
+class ImageFetcher:
+    def __init__(self):
+        settings = config_manager.get('fetch', {})
+        self.connect_timeout = settings.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = settings.get('read_timeout', DEFAULT_READ_TIMEOUT)
+        self.max_bytes = int(settings.get('max_mb', DEFAULT_MAX_MB) * 1024 * 1024)
+        self.limit_per_host = settings.get('limit_per_host', DEFAULT_LIMIT_PER_HOST)
+        self.keepalive_timeout = settings.get('keepalive_timeout', DEFAULT_KEEPALIVE)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def fetch(self, url: str, decode: bool = True) -> ImageSource:
+        """
+        Download and decode an image. Chunks are fed to a StreamDecoder on
+        the decode thread as they arrive, so decoding overlaps the transfer
+        and oversized images are rejected from their header.
+        With decode=False only the header is parsed (for the size check)
+        and the raw bytes are returned, for decoding elsewhere.
+        """
+        # Imported here so the app starts without loading Pillow
+        from .decoder import StreamDecoder, pixel_budget
+
+        logger.info(f"Downloading image from {url}...")
+        loop = asyncio.get_running_loop()
+        decoder = StreamDecoder(config_manager.printer_setting('width'), pixel_budget(), header_only=not decode)
+        digest = hashlib.sha256()
+        received = 0
+        pending = None
+        body = bytearray()
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+
+        session = self._get_session()
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise FetchError(f"Failed to download image. Status: {response.status}")
+                if response.content_length and response.content_length > self.max_bytes:
+                    raise FetchError(f"Image too large: {response.content_length} bytes")
+
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise FetchError(f"Image exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    if not decode:
+                        body += chunk
+                    # Surface decode errors (e.g. over the pixel budget) without waiting for the body
+                    if pending is not None and pending.done():
+                        pending.result()
+                    if not decode and decoder.image is not None:
+                        continue  # header checked, nothing more to parse
+                    pending = loop.run_in_executor(_decode_executor, _timed_call, timings, decoder.feed, chunk)
+                    pending.add_done_callback(_consume_exception)
+            if pending is not None:
+                await pending
+            if not decode:
+                if decoder.image is None:
+                    raise FetchError("Failed to decode image: unrecognised format")
+                logger.info(f"Image downloaded. {received} bytes, size: {decoder.image.size}")
+                return ImageSource(data=bytes(body), digest=digest.hexdigest(), url=url, timings=timings)
+            image = await loop.run_in_executor(_decode_executor, _timed_call, timings, decoder.close)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise FetchError(f"Failed to download image: {e!r}") from e
+        except OSError as e:
+            raise FetchError(f"Failed to decode image: {e}") from e
+        finally:
+            # Let any feeds still queued on the decode thread return immediately
+            decoder.finished = 1
+            add_time(timings, 'fetch', time.perf_counter() - start)
+
+        logger.info(f"Image downloaded and decoded. {received} bytes, size: {image.size}, mode: {image.mode}")
+        return ImageSource(image=image, digest=digest.hexdigest(), url=url, timings=timings)
+
+    async def from_base64(self, content: str) -> ImageSource:
+        """Decode inline Base64 content on the decode thread, off the event loop."""
+        timings: Dict[str, float] = {}
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(_decode_executor, _timed_call, timings, decode_base64, content)
+        return ImageSource(data=data, timings=timings)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+def _timed_call(timings: Dict[str, float], func, *args):
+    with timed(timings, 'decode'):
+        return func(*args)
+
+
+def _consume_exception(future: asyncio.Future):
+    # Errors are re-raised by the fetch loop; this only silences "never retrieved" warnings
+    if not future.cancelled():
+        future.exception()
+
+
+# Incremental decoding runs here so it overlaps the download without blocking the event loop
+_decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='decode')
+
+image_fetcher = ImageFetcher()
@@ -0,0 +1,109 @@
+"""
+Ledger of finished print jobs for PrintsAlot.
+Remembers the final status of recent job_ids across restarts, so a job the
+relay resends after a reconnect is acknowledged instead of printed twice.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .config_manager import config_manager
+
+logger = logging.getLogger('PrintsAlot.ledger')
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_AGE_HOURS = 24
+
+
+class JobLedger:
+    """
+    Bounded map of job_id -> final status, oldest first, evicted by count
+    and age. Persisted as an append-only JSON-lines file that is rewritten
+    once it holds twice as many lines as live entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age: float = DEFAULT_MAX_AGE_HOURS * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The recorded outcome of a job ({'status', 'reason', 'at'}), or None if not seen recently."""
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry and time.time() - entry['at'] > self.max_age:
+                del self._entries[job_id]
+                return None
+            return entry
+
+    def record(self, job_id: str, status: str, reason: Optional[str] = None):
+        entry = {'status': status, 'reason': reason, 'at': time.time()}
+        with self._lock:
+            self._entries.pop(job_id, None)
+            self._entries[job_id] = entry
+            self._evict()
+            try:
+                if self._lines >= 2 * self.max_entries:
+                    self._compact()
+                else:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps({'job_id': job_id, **entry}) + '\n')
+                    self._lines += 1
+            except OSError as e:
+                logger.warning(f"Could not persist job ledger: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self):
+        cutoff = time.time() - self.max_age
+        while self._entries:
+            job_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and entry['at'] >= cutoff:
+                break
+            del self._entries[job_id]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        record = json.loads(line)
+                        job_id = record.pop('job_id')
+                    except (ValueError, KeyError, AttributeError):
+                        continue  # torn last line from a crash
+                    self._entries.pop(job_id, None)
+                    self._entries[job_id] = record
+        except OSError as e:
+            logger.warning(f"Could not read job ledger: {e}")
+            return
+        self._evict()
+        logger.info(f"Job ledger loaded: {len(self._entries)} recent jobs")
+
+    def _compact(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for job_id, entry in self._entries.items():
+                f.write(json.dumps({'job_id': job_id, **entry}) + '\n')
+        os.replace(tmp, self.path)
+        self._lines = len(self._entries)
+
+
+_ledger_settings = config_manager.get('ledger', {})
+job_ledger = JobLedger(
+    os.path.join(config_manager.directory, 'job_ledger.jsonl'),
+    max_entries=_ledger_settings.get('max_entries', DEFAULT_MAX_ENTRIES),
+    max_age=_ledger_settings.get('max_age_hours', DEFAULT_MAX_AGE_HOURS) * 3600,
+)
@@ -0,0 +1,638 @@
+"""
+Print job queue for PrintsAlot.
+Dispatches incoming print jobs across a pool of printers, each served by
+its own dedicated printer thread.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from . import metrics
+from .config_manager import config_manager
+from .fetcher import FetchError, ImageSource, as_image_bytes, image_fetcher
+from .journal import DONE, FAILED, FETCHED, PRINTING, RECEIVED, job_journal
+from .raster_cache import CacheMissError, raster_cache
+from .render_pool import render_pool
+from .timing import add_time, as_millis
+
+logger = logging.getLogger('PrintsAlot.jobs')
+
+DEFAULT_MAX_DEPTH = 20
+DEFAULT_COALESCE_JOBS = 8
+
+# While a printer is busy, up to this many of its next jobs are downloaded
+# and rendered ahead, holding at most this much raster data
+DEFAULT_PREFETCH_DEPTH = 2
+DEFAULT_PREFETCH_MB = 32
+
+# Used when config.json has no "printers" list: a single TM-T88IV
+DEFAULT_DEVICE = {'name': 'printer', 'vid': 0x04b8, 'pid': 0x0202}
+
+
+class PrintJob:
+    def __init__(self, job_id: Optional[str], content: Any, auto_cut: bool = True, data: Optional[dict] = None):
+        self.job_id = job_id
+        self.content = content
+        self.auto_cut = auto_cut
+        self.data = data or {}
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.attempts = 0
+        self.printer: Optional[str] = None
+        self.timings: Dict[str, float] = {}  # stage -> seconds, see timing.STAGES
+        self.finished_at: Optional[float] = None
+        self.prefetch: Optional[asyncio.Task] = None  # resolves to a rendered ImageSource
+        self.reserved = 0  # prefetch budget held, in bytes
+        self.prefetch_settings: Optional[tuple] = None  # render settings the prefetch used
+
+    def timings_ms(self) -> Dict[str, float]:
+        """Stage timings in milliseconds, plus the total since the job was queued."""
+        timings = as_millis(self.timings)
+        end = self.finished_at or time.monotonic()
+        timings['total'] = round((end - self.enqueued_at) * 1000, 1)
+        return timings
+
+
+class JobQueue(asyncio.Queue):
+    """asyncio.Queue that can look at the jobs waiting next, for prefetching."""
+
+    def peek(self, count: int) -> List[PrintJob]:
+        return list(itertools.islice(self._queue, count))
+
+
+class PrinterWorker:
+    """
+    One printer in the pool: its own FIFO and its own executor thread.
+    The thread creates and owns the printer handle, so ESC/POS byte
+    streams from different jobs never interleave.
+    """
+
+    def __init__(self, name: str, device: dict):
+        self.name = name
+        self.device = device
+        self.queue = JobQueue()
+        self.busy = False
+        self.healthy = True
+        self.retired = False  # removed from the config; stops after its current job
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'printer-{name}')
+        self._printer = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def load(self) -> int:
+        return self.queue.qsize() + (1 if self.busy else 0)
+
+    def get_printer(self):
+        """This worker's PrinterWrapper. Must be called on the worker's thread."""
+        if self._printer is None:
+            from .printer import PrinterWrapper
+            self._printer = PrinterWrapper(self.device)
+        return self._printer
+
+    def reopen(self, device: dict):
+        """Use a changed device config. The handle is reopened after the job in progress."""
+        self.device = device
+        self._executor.submit(self._close_printer)
+
+    async def close(self):
+        """Release the printer once work already scheduled on its thread is done."""
+        await self.run(self._close_printer)
+        self._executor.shutdown(wait=False)
+
+    def _close_printer(self):
+        printer, self._printer = self._printer, None
+        if printer is not None and printer.printer is not None:
+            try:
+                printer.printer.close()
+            except Exception as e:
+                logger.warning(f"Closing printer {self.name} failed: {e}")
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run a function on this printer's thread, after any work already scheduled there."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'healthy': self.healthy,
+            'busy': self.busy,
+            'depth': self.queue.qsize(),
+            'completed': self.jobs_completed,
+            'failed': self.jobs_failed,
+        }
+
+    def transfer_stats(self) -> Dict[str, float]:
+        """USB transfer totals from this worker's printer. Only reads counters its thread updates."""
+        printer = self._printer
+        if printer is None:
+            return {}
+        return {
+            'bytes': printer.bytes_sent_total,
+            'seconds': printer.write_time_total,
+            'bytes_per_sec': printer.last_transfer.get('bytes_per_sec', 0.0),
+        }
+
+
+def configured_devices() -> List[dict]:
+    devices = config_manager.get('printers') or [DEFAULT_DEVICE]
+    named = []
+    for i, device in enumerate(devices):
+        device = dict(device)
+        device.setdefault('name', f'printer{i + 1}')
+        named.append(device)
+    return named
+
+
+class PrintQueue:
+    """
+    Bounded pool of print jobs, dispatched to the idle or least-loaded
+    healthy printer. Each printer consumes its own queue in FIFO order.
+    """
+
+    def __init__(self, max_depth: Optional[int] = None):
+        queue_settings = config_manager.get('queue', {})
+        self.max_depth = max_depth or queue_settings.get('max_depth', DEFAULT_MAX_DEPTH)
+        # Optional: print small jobs that pile up as one stack with a single cut
+        self.coalesce = queue_settings.get('coalesce', {})
+        self.workers = [PrinterWorker(device['name'], device) for device in configured_devices()]
+        self._on_complete: Optional[Callable[[PrintJob, str, Optional[str]], Awaitable[None]]] = None
+        self._pending: Set[str] = set()  # job_ids queued or printing
+
+        prefetch = config_manager.get('prefetch', {})
+        self.prefetch_enabled = prefetch.get('enabled', True)
+        self.prefetch_depth = prefetch.get('depth', DEFAULT_PREFETCH_DEPTH)
+        self.prefetch_budget = int(prefetch.get('max_mb', DEFAULT_PREFETCH_MB) * 1024 * 1024)
+        self._prefetch_reserved = 0
+
+        config_manager.subscribe(('printers',), self._on_printers_changed)
+        config_manager.subscribe(('printer_settings',), self._on_settings_changed)
+
+        # Counters
+        self.jobs_accepted = 0
+        self.jobs_rejected = 0
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.peak_depth = 0
+        self.last_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.total_wait_time = 0.0
+
+    def on_complete(self, callback: Callable[[PrintJob, str, Optional[str]], Awaitable[None]]):
+        """Set a coroutine called as callback(job, status, reason) when a job finishes."""
+        self._on_complete = callback
+
+    def has_job(self, job_id: str) -> bool:
+        """Whether a job is still queued or printing."""
+        return job_id in self._pending
+
+    @property
+    def depth(self) -> int:
+        return sum(worker.queue.qsize() for worker in self.workers)
+
+    def submit(self, job: PrintJob) -> bool:
+        """
+        Queue a job for printing.
+        Returns False if the queue is full and the job was rejected.
+        """
+        self._ensure_workers()
+        if self.depth >= self.max_depth:
+            self.jobs_rejected += 1
+            logger.warning(f"Print queue full ({self.max_depth}), rejecting job {job.job_id}")
+            return False
+
+        if job.job_id:
+            if job.job_id not in self._pending:
+                job_journal.received(job.job_id, job.content, job.auto_cut, job.data)
+            self._pending.add(job.job_id)
+        worker = self._pick_worker()
+        worker.queue.put_nowait(job)
+        self._schedule_prefetch(worker)
+        self.jobs_accepted += 1
+        self.peak_depth = max(self.peak_depth, self.depth)
+        logger.info(f"Queued job {job.job_id} on {worker.name} (depth {self.depth}/{self.max_depth})")
+        return True
+
+    def set_health(self, worker: PrinterWorker, healthy: bool):
+        """Take a printer out of rotation, or put it back. Jobs waiting on a failed printer move elsewhere."""
+        if worker.healthy == healthy:
+            return
+        worker.healthy = healthy
+        if healthy:
+            logger.info(f"Printer {worker.name} is back in rotation")
+            return
+
+        logger.warning(f"Printer {worker.name} taken out of rotation")
+        if not any(w.healthy for w in self.workers):
+            return
+        moved = 0
+        while not worker.queue.empty():
+            job = worker.queue.get_nowait()
+            worker.queue.task_done()
+            self._pick_worker().queue.put_nowait(job)
+            moved += 1
+        if moved:
+            logger.info(f"Moved {moved} queued jobs off {worker.name}")
+            for other in self.workers:
+                self._schedule_prefetch(other)
+
+    async def open_printers(self):
+        """
+        Open every printer on its own thread. Run in the background after
+        startup, so USB setup and the printer imports don't delay the UI.
+        """
+        await asyncio.gather(*(worker.run(worker.get_printer) for worker in self.workers))
+
+    def reconfigure(self, devices: List[dict]):
+        """
+        Apply a changed printer list. New printers join the pool, changed
+        ones reopen their device after the job they're printing, and removed
+        ones finish their current job and hand their queue to the rest.
+        """
+        current = {worker.name: worker for worker in self.workers}
+        workers = []
+        for device in devices:
+            worker = current.pop(device['name'], None)
+            if worker is None:
+                logger.info(f"Adding printer {device['name']}")
+                worker = PrinterWorker(device['name'], device)
+            elif worker.device != device:
+                logger.info(f"Printer {worker.name} changed, reopening it after its current job")
+                worker.reopen(device)
+            workers.append(worker)
+        self.workers = workers
+        self._ensure_workers()
+
+        for worker in current.values():
+            logger.info(f"Removing printer {worker.name}")
+            worker.retired = True
+            moved = 0
+            while not worker.queue.empty():
+                job = worker.queue.get_nowait()
+                worker.queue.task_done()
+                self._pick_worker().queue.put_nowait(job)
+                moved += 1
+            if moved:
+                logger.info(f"Moved {moved} queued jobs off {worker.name}")
+            if not worker.busy:
+                if worker.task is not None:
+                    worker.task.cancel()  # idle, waiting for a job
+                asyncio.create_task(worker.close())
+        for worker in self.workers:
+            self._schedule_prefetch(worker)
+
+    def _on_printers_changed(self, changed: Set[str]):
+        self.reconfigure(configured_devices())
+
+    def _on_settings_changed(self, changed: Set[str]):
+        # Jobs render with the settings current when they start; prefetched rasters are checked in _prepare
+        logger.info(f"Printer settings changed: {self._render_settings()}")
+
+    @staticmethod
+    def _render_settings() -> tuple:
+        return tuple(config_manager.printer_setting(key) for key in ('width', 'dither', 'max_px_height'))
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.jobs_completed + self.jobs_failed
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'peak_depth': self.peak_depth,
+            'accepted': self.jobs_accepted,
+            'rejected': self.jobs_rejected,
+            'completed': self.jobs_completed,
+            'failed': self.jobs_failed,
+            'last_wait': self.last_wait_time,
+            'max_wait': self.max_wait_time,
+            'avg_wait': self.total_wait_time / finished if finished else 0.0,
+            'prefetched_bytes': self._prefetch_reserved,
+            'printers': [worker.stats() for worker in self.workers],
+        }
+
+    def _pick_worker(self, exclude: Optional[PrinterWorker] = None) -> PrinterWorker:
+        candidates = [w for w in self.workers if w is not exclude] or self.workers
+        # Prefer healthy printers, but keep accepting jobs if every printer is down
+        healthy = [w for w in candidates if w.healthy]
+        return min(healthy or candidates, key=lambda w: w.load)
+
+    def _ensure_workers(self):
+        for worker in self.workers:
+            if worker.task is None or worker.task.done():
+                worker.task = asyncio.create_task(self._worker(worker))
+
+    async def _worker(self, worker: PrinterWorker):
+        while True:
+            jobs = [await worker.queue.get()]
+            if self.coalesce.get('enabled', False):
+                jobs += self._take_batch(worker, jobs[0])
+            worker.busy = True
+            self._schedule_prefetch(worker)
+            try:
+                if len(jobs) == 1:
+                    await self._process(worker, jobs[0])
+                else:
+                    await self._process_batch(worker, jobs)
+            except Exception as e:
+                logger.error(f"Unexpected error processing jobs {[job.job_id for job in jobs]}: {e}", exc_info=True)
+            finally:
+                worker.busy = False
+                for _ in jobs:
+                    worker.queue.task_done()
+            if worker.retired:
+                await worker.close()
+                return
+
+    def _take_batch(self, worker: PrinterWorker, first: PrintJob) -> List[PrintJob]:
+        """
+        Jobs already waiting behind `first` that can be printed with it as one
+        stack. A job without auto_cut ends the stack, since its paper stays attached.
+        """
+        max_jobs = self.coalesce.get('max_jobs', DEFAULT_COALESCE_JOBS)
+        batch = []
+        last = first
+        while len(batch) + 1 < max_jobs and last.auto_cut and not worker.queue.empty():
+            last = worker.queue.get_nowait()
+            batch.append(last)
+        return batch
+
+    def _start(self, worker: PrinterWorker, job: PrintJob):
+        job.started_at = time.monotonic()
+        job.printer = worker.name
+        if job.attempts == 0:
+            wait = job.started_at - job.enqueued_at
+            self.last_wait_time = wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+            self.total_wait_time += wait
+            add_time(job.timings, 'queue_wait', wait)
+            logger.info(f"Starting job {job.job_id} on {worker.name} after {wait:.2f}s in queue")
+        job.attempts += 1
+
+    async def _process(self, worker: PrinterWorker, job: PrintJob):
+        self._start(worker, job)
+        error = None
+        try:
+            source = await self._prepare(job)
+            self._transition(job, PRINTING)
+            try:
+                await worker.run(self._print, worker, job, source)
+            except CacheMissError:
+                await self._print_refetched(worker, job, source)
+        except Exception as e:
+            error = e
+        await self._finish(worker, job, error)
+
+    async def _print_refetched(self, worker: PrinterWorker, job: PrintJob, source: ImageSource):
+        """Print a job whose cached raster was evicted while it waited, downloading its image again."""
+        logger.info(f"Cached raster for job {job.job_id} was evicted, downloading it again")
+        source = await image_fetcher.fetch(source.url, decode=not render_pool.enabled)
+        self._add_timings(job, source)
+        await worker.run(self._print, worker, job, source)
+
+    async def _process_batch(self, worker: PrinterWorker, jobs: List[PrintJob]):
+        """Print several waiting jobs as one stack with a single cut, reporting each job separately."""
+        logger.info(f"Coalescing {len(jobs)} jobs on {worker.name}: {[job.job_id for job in jobs]}")
+        for job in jobs:
+            self._start(worker, job)
+
+        errors: Dict[int, Optional[Exception]] = {}
+        loaded = await asyncio.gather(*(self._prepare(job) for job in jobs), return_exceptions=True)
+        printable = []
+        for job, result in zip(jobs, loaded):
+            if isinstance(result, Exception):
+                errors[id(job)] = result
+            else:
+                printable.append((job, result))
+
+        if printable:
+            for job, _ in printable:
+                self._transition(job, PRINTING)
+            auto_cut = printable[-1][0].auto_cut
+            sources = [source for _, source in printable]
+            try:
+                results = await worker.run(self._print_batch, worker, sources, auto_cut,
+                                           [job.timings for job, _ in printable])
+            except Exception as e:
+                results = [e] * len(printable)
+            for (job, source), error in zip(printable, results):
+                if isinstance(error, CacheMissError):
+                    # Printed on its own after the stack
+                    try:
+                        await self._print_refetched(worker, job, source)
+                        error = None
+                    except Exception as e:
+                        error = e
+                errors[id(job)] = error
+
+        for job in jobs:
+            await self._finish(worker, job, errors.get(id(job)))
+
+    async def _finish(self, worker: PrinterWorker, job: PrintJob, error: Optional[Exception]):
+        status, reason = 'completed', None
+        if error is None:
+            logger.info(f"Print completed successfully for job {job.job_id}")
+        else:
+            from .decoder import ImageTooLargeError
+            status, reason = 'failed', self._failure_reason(error)
+            expected = reason != 'error' or isinstance(error, (FetchError, ImageTooLargeError))
+            logger.error(f"Printing failed for job {job.job_id} on {worker.name}: {error}",
+                         exc_info=None if expected else error)
+
+        if status == 'completed':
+            worker.jobs_completed += 1
+            self.jobs_completed += 1
+            self.set_health(worker, True)
+        else:
+            worker.jobs_failed += 1
+            if reason in ('out_of_paper', 'offline'):
+                self.set_health(worker, False)
+                # Give the job to another printer rather than failing it
+                retry = self._pick_worker(exclude=worker)
+                if retry.healthy and retry is not worker and job.attempts < len(self.workers):
+                    logger.info(f"Retrying job {job.job_id} on {retry.name}")
+                    self._transition(job, RECEIVED)
+                    retry.queue.put_nowait(job)
+                    return
+            self.jobs_failed += 1
+
+        await self._report(job, status, reason)
+
+    async def recover(self):
+        """
+        Pick up jobs the journal shows were accepted but never finished,
+        e.g. before a restart or crash. Jobs not yet sent to a printer are
+        queued again; a job that was mid-print is failed rather than risk
+        printing it twice.
+        """
+        for entry in job_journal.unfinished():
+            job = PrintJob(entry['job_id'], entry['content'], entry['auto_cut'], entry['data'])
+            if entry['state'] == PRINTING or not entry['content']:
+                logger.warning(f"Job {job.job_id} was interrupted while printing, reporting it failed")
+                self.jobs_failed += 1
+                await self._report(job, 'failed', 'interrupted')
+            elif self.submit(job):
+                logger.info(f"Resuming job {job.job_id} from the journal")
+            else:
+                await self._report(job, 'failed', 'queue_full')
+
+    async def _report(self, job: PrintJob, status: str, reason: Optional[str]):
+        job.finished_at = time.monotonic()
+        logger.info("Job timings " + json.dumps({
+            'job_id': job.job_id, 'status': status, 'reason': reason, 'printer': job.printer, 'ms': job.timings_ms(),
+        }))
+        self._record_metrics(job, status, reason)
+        if job.job_id:
+            self._pending.discard(job.job_id)
+            self._transition(job, DONE if status == 'completed' else FAILED, reason)
+        if self._on_complete:
+            try:
+                await self._on_complete(job, status, reason)
+            except Exception as e:
+                logger.error(f"Failed to report job {job.job_id}: {e}", exc_info=True)
+
+    @staticmethod
+    def _record_metrics(job: PrintJob, status: str, reason: Optional[str]):
+        if status == 'completed':
+            metrics.jobs_completed.inc()
+        else:
+            metrics.jobs_failed.inc(reason=reason or 'error')
+        for stage, seconds in job.timings.items():
+            metrics.stage_seconds.observe(seconds, stage=stage)
+        metrics.job_seconds.observe(job.finished_at - job.enqueued_at)
+
+    def _schedule_prefetch(self, worker: PrinterWorker):
+        """
+        Start fetching and rendering the jobs waiting behind a busy printer,
+        so it gets their rasters back to back. Each prefetch reserves the
+        largest raster the current settings allow against the budget.
+        """
+        if not self.prefetch_enabled or not worker.busy:
+            return
+        width = config_manager.printer_setting('width')
+        reserve = (width + 7) // 8 * config_manager.printer_setting('max_px_height')
+        for job in worker.queue.peek(self.prefetch_depth):
+            if job.prefetch is not None:
+                continue
+            if self._prefetch_reserved + reserve > self.prefetch_budget:
+                break
+            job.reserved = reserve
+            self._prefetch_reserved += reserve
+            job.prefetch_settings = self._render_settings()
+            job.prefetch = asyncio.create_task(self._prefetch(job))
+
+    async def _prefetch(self, job: PrintJob) -> ImageSource:
+        source = await self._load(job)
+        self._add_timings(job, source)
+        self._transition(job, FETCHED)
+        if source.image is None and source.data is None:
+            return source  # cached raster, nothing to render
+        logger.info(f"Pre-rendering job {job.job_id}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_render_executor, self._prerender, source, job.timings)
+
+    async def _prepare(self, job: PrintJob) -> ImageSource:
+        """A job's image, from its prefetch if one was started, otherwise loaded now."""
+        if job.prefetch is not None:
+            task, job.prefetch = job.prefetch, None
+            try:
+                source = await task
+            finally:
+                self._prefetch_reserved -= job.reserved
+                job.reserved = 0
+            if job.prefetch_settings == self._render_settings():
+                return source
+            logger.info(f"Printer settings changed since job {job.job_id} was pre-rendered, rendering it again")
+        source = await self._load(job)
+        self._add_timings(job, source)
+        self._transition(job, FETCHED)
+        return source
+
+    @staticmethod
+    def _prerender(source: ImageSource, timings: Dict[str, float]) -> ImageSource:
+        from .printer import prerender
+        return prerender(source, timings)
+
+    async def _load(self, job: PrintJob) -> ImageSource:
+        """
+        Resolve job content on the event loop: a URL is downloaded and
+        decoded, unless its raster is already cached; inline content is
+        handed over as bytes, Base64 being decoded on the decode thread.
+        """
+        content = job.content
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return ImageSource(data=as_image_bytes(content))
+        if not content.startswith('http'):
+            return await image_fetcher.from_base64(content)
+
+        digest = raster_cache.lookup_url(content)
+        if digest:
+            key = raster_cache.key_for(digest)
+            if raster_cache.contains(key):
+                return ImageSource(digest=digest, cache_key=key, url=content)
+        # With the process pool, decoding happens there rather than during the download
+        return await image_fetcher.fetch(content, decode=not render_pool.enabled)
+
+    @staticmethod
+    def _add_timings(job: PrintJob, source: ImageSource):
+        for stage, seconds in source.timings.items():
+            add_time(job.timings, stage, seconds)
+
+    @staticmethod
+    def _print(worker: PrinterWorker, job: PrintJob, source: ImageSource):
+        worker.get_printer().print_image(source, job.auto_cut, job.timings)
+
+    @staticmethod
+    def _transition(job: PrintJob, state: str, reason: Optional[str] = None):
+        if job.job_id:
+            job_journal.transition(job.job_id, state, reason)
+
+    def _print_batch(self, worker: PrinterWorker, sources: List[ImageSource], auto_cut: bool,
+                     timings: List[Dict[str, float]]) -> List[Optional[Exception]]:
+        max_px_height = self.coalesce.get('max_px_height', config_manager.printer_setting('max_px_height'))
+        return worker.get_printer().print_batch(sources, auto_cut, max_px_height, timings)
+
+    @staticmethod
+    def _failure_reason(error: Exception) -> str:
+        try:
+            from .printer import OfflineError, PaperError
+        except Exception:
+            return 'error'
+        if isinstance(error, PaperError):
+            return 'out_of_paper'
+        if isinstance(error, OfflineError):
+            return 'offline'
+        return 'error'
+
+
+# Renders prefetched jobs, so a printer thread only sends them. With the
+# process pool these threads just wait on it, one per pool process.
+_render_executor = ThreadPoolExecutor(max_workers=max(1, render_pool.processes), thread_name_prefix='render')
+
+print_queue = PrintQueue()
+
+
+def _transfer_stat(key: str) -> Callable[[], Dict[str, float]]:
+    def collect() -> Dict[str, float]:
+        stats = ((worker.name, worker.transfer_stats()) for worker in print_queue.workers)
+        return {name: transfer[key] for name, transfer in stats if transfer}
+    return collect
+
+
+metrics.collected('printsalot_queue_depth', 'Jobs waiting for a printer.', lambda: print_queue.depth)
+metrics.collected('printsalot_queue_max_depth', 'Jobs that can wait before new ones are rejected.',
+                  lambda: print_queue.max_depth)
+metrics.collected('printsalot_printer_busy', 'Whether each printer is printing.',
+                  lambda: {worker.name: int(worker.busy) for worker in print_queue.workers}, label='printer')
+metrics.collected('printsalot_printer_healthy', 'Whether each printer is in rotation.',
+                  lambda: {worker.name: int(worker.healthy) for worker in print_queue.workers}, label='printer')
+metrics.collected('printsalot_usb_bytes_total', 'Bytes written to each printer.',
+                  _transfer_stat('bytes'), type='counter', label='printer')
+metrics.collected('printsalot_usb_write_seconds_total', 'Time spent writing to each printer.',
+                  _transfer_stat('seconds'), type='counter', label='printer')
+metrics.collected('printsalot_usb_bytes_per_second', "Each printer's throughput over its last job.",
+                  _transfer_stat('bytes_per_sec'), label='printer')
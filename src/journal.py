@@ -0,0 +1,156 @@
+"""
+Crash-safe job journal for PrintsAlot.
+Records each accepted job's state transitions in SQLite (WAL mode) next to
+config.json, so jobs interrupted by a restart or crash are resumed or
+failed cleanly, and job_updates the relay never received are sent again.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .config_manager import config_manager
+
+logger = logging.getLogger('PrintsAlot.journal')
+
+# Job states, in order
+RECEIVED = 'received'
+FETCHED = 'fetched'
+PRINTING = 'printing'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATES = (DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    content BLOB,
+    auto_cut INTEGER NOT NULL DEFAULT 1,
+    data TEXT,
+    reason TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JobJournal:
+    """
+    One row per unfinished or unreported job. A row is written when a job
+    is accepted, updated on each transition, and deleted once its final
+    job_update has reached the relay.
+
+    WAL mode with synchronous=NORMAL keeps commits off fsync: the log is
+    only synced at checkpoints, and a power cut can lose the last few
+    transitions but never corrupts the file.
+
+    Writes run in order on a writer thread, so inserting a job's payload
+    never blocks the event loop. Reads queue behind pending writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(_SCHEMA)
+        except sqlite3.Error as e:
+            logger.error(f"Job journal unavailable, jobs won't survive restarts: {e}")
+            self._db = None
+
+    def received(self, job_id: str, content: Any, auto_cut: bool, data: Optional[dict] = None):
+        if isinstance(content, (bytearray, memoryview)):
+            content = bytes(content)
+        # The payload is kept in `content`; the rest of the event only needs to be JSON-safe
+        extra = {k: v for k, v in (data or {}).items() if k not in ('content', 'file_url')}
+        self._execute(
+            'INSERT OR REPLACE INTO jobs (job_id, state, content, auto_cut, data, reason, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, NULL, ?)',
+            (job_id, RECEIVED, content, int(auto_cut), json.dumps(extra, default=str), time.time()),
+        )
+
+    def transition(self, job_id: str, state: str, reason: Optional[str] = None):
+        if state in FINISHED_STATES:
+            # The payload isn't needed any more, only the outcome to report
+            self._execute('UPDATE jobs SET state = ?, reason = ?, content = NULL, updated_at = ? WHERE job_id = ?',
+                          (state, reason, time.time(), job_id))
+        else:
+            self._execute('UPDATE jobs SET state = ?, updated_at = ? WHERE job_id = ?',
+                          (state, time.time(), job_id))
+
+    def reported(self, job_id: str):
+        """The relay has the job's final status; forget it."""
+        self._execute('DELETE FROM jobs WHERE job_id = ? AND state IN (?, ?)', (job_id, *FINISHED_STATES))
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Jobs that were accepted but never finished, oldest first."""
+        rows = self._query('SELECT job_id, state, content, auto_cut, data FROM jobs '
+                           'WHERE state NOT IN (?, ?) ORDER BY updated_at', FINISHED_STATES)
+        return [
+            {'job_id': job_id, 'state': state, 'content': content,
+             'auto_cut': bool(auto_cut), 'data': json.loads(data) if data else {}}
+            for job_id, state, content, auto_cut, data in rows
+        ]
+
+    def unreported(self) -> List[Dict[str, Any]]:
+        """Finished jobs whose job_update hasn't been delivered, oldest first."""
+        rows = self._query('SELECT job_id, state, reason FROM jobs '
+                           'WHERE state IN (?, ?) ORDER BY updated_at', FINISHED_STATES)
+        return [
+            {'job_id': job_id, 'status': 'completed' if state == DONE else 'failed', 'reason': reason}
+            for job_id, state, reason in rows
+        ]
+
+    def close(self):
+        """Finish pending writes, then close the database."""
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _execute(self, sql: str, params: tuple):
+        if self._db is None:
+            return
+        try:
+            self._writer.submit(self._write, sql, params)
+        except RuntimeError:
+            logger.warning("Job journal closed, dropping write")
+
+    def _write(self, sql: str, params: tuple):
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.warning(f"Job journal write failed: {e}")
+
+    def _query(self, sql: str, params: tuple) -> list:
+        if self._db is None:
+            return []
+        try:
+            return self._writer.submit(self._read, sql, params).result()
+        except RuntimeError:
+            return []
+
+    def _read(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            if self._db is None:
+                return []
+            try:
+                return self._db.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Job journal read failed: {e}")
+                return []
+
+
+job_journal = JobJournal(os.path.join(config_manager.directory, 'jobs.db'))
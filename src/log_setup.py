@@ -0,0 +1,123 @@
+"""
+Logging setup for PrintsAlot.
+Records are handed to a queue by whichever thread logs them and written
+to a size-rotated log file by a background listener thread, so the event
+loop never waits on the disk. Credentials and long payload strings are
+cut out of each message before it is queued.
+"""
+import atexit
+import logging
+import multiprocessing
+import queue
+import re
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from .config_manager import config_manager
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_MAX_MB = 5
+DEFAULT_BACKUPS = 3
+DEFAULT_MAX_FIELD_CHARS = 200  # longer base64-like runs are shortened
+DEFAULT_MAX_MESSAGE_CHARS = 4000
+
+# `token: abc`, `'token': 'abc'`, `token=abc` and the like
+_SECRET = re.compile(
+    r"""((?<![\w-])['"]?(?:token|access_token|refresh_token|password|secret|authorization)['"]?\s*[:=]\s*)(['"]?)[^'"\s,}&]+""",
+    re.IGNORECASE,
+)
+_KEEP_CHARS = 16
+
+_listener: Optional[QueueListener] = None
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Rewrites a record's message with secrets masked, base64 payloads and
+    other long unbroken runs shortened, and the whole message capped.
+    """
+
+    def __init__(self, max_field_chars: int = DEFAULT_MAX_FIELD_CHARS,
+                 max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+        self._payload = re.compile(r'[A-Za-z0-9+/=_-]{%d,}' % max(max_field_chars, _KEEP_CHARS + 1))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = self.redact(message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+    def redact(self, message: str) -> str:
+        message = _SECRET.sub(r'\1\2<redacted>', message)
+        message = self._payload.sub(lambda m: f"{m.group()[:_KEEP_CHARS]}...<{len(m.group())} chars>", message)
+        if len(message) > self.max_message_chars:
+            message = f"{message[:self.max_message_chars]}...<{len(message)} chars>"
+        return message
+
+
+def setup_logging(log_file: str):
+    """
+    Log everything through a queue to `log_file`, configured from the
+    `logging` config section. Render pool worker processes leave the
+    file to the main process.
+    """
+    global _listener
+    if _listener is not None or multiprocessing.parent_process() is not None:
+        return
+    settings = config_manager.get('logging', {})
+
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=int(settings.get('max_mb', DEFAULT_MAX_MB) * 1024 * 1024),
+        backupCount=settings.get('backups', DEFAULT_BACKUPS),
+        encoding='utf-8',
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(RedactingFilter(
+        settings.get('max_field_chars', DEFAULT_MAX_FIELD_CHARS),
+        settings.get('max_message_chars', DEFAULT_MAX_MESSAGE_CHARS),
+    ))
+    logging.getLogger().addHandler(queue_handler)
+    try:
+        set_level(settings.get('level', DEFAULT_LEVEL))
+    except ValueError as e:
+        set_level(DEFAULT_LEVEL)
+        logging.getLogger('PrintsAlot').warning(f"{e}, using {DEFAULT_LEVEL}")
+
+    _listener = QueueListener(records, file_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+    config_manager.subscribe(('logging',), _on_config_changed)
+
+
+def _on_config_changed(changed):
+    set_level(config_manager.get('logging', {}).get('level', DEFAULT_LEVEL))
+
+
+def set_level(level: str):
+    """Change the log level at runtime."""
+    level = str(level).upper()
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level {level!r}")
+    logging.getLogger().setLevel(level)
+
+
+def get_level() -> str:
+    return logging.getLevelName(logging.getLogger().level)
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
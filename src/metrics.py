@@ -0,0 +1,233 @@
+"""
+Prometheus metrics for PrintsAlot, served as text at /metrics.
+Recording a metric is an in-place update of a plain number, made on the
+event loop thread, so it costs next to nothing and never takes a lock.
+Values owned by other components, like queue depth, are read at scrape time.
+"""
+import bisect
+import math
+import os
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds. Stages range from sub-millisecond cuts to multi-second downloads.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Number = Union[int, float]
+LabelSet = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, LabelSet, Number]
+
+
+def _label_set(labels: Dict[str, str]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: Number) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+    return repr(value)
+
+
+def _format_sample(name: str, labels: LabelSet, value: Number) -> str:
+    if labels:
+        pairs = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+        return f"{name}{{{pairs}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(_format_sample(*sample) for sample in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelled: bool = False):
+        super().__init__(name, help)
+        self._values: Dict[LabelSet, Number] = {}
+        if not labelled:
+            self._values[()] = 0  # reported from the start, not only after the first event
+
+    def inc(self, amount: Number = 1, **labels: str):
+        key = _label_set(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: Number, **labels: str):
+        self._values[_label_set(labels)] = value
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram. Bucket counts are kept per bucket and summed when scraped."""
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, labelled: bool = False):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelSet, List[Number]] = {}  # labels -> bucket counts + [+Inf, sum, count]
+        if not labelled:
+            self._new_series(())
+
+    def observe(self, value: float, **labels: str):
+        key = _label_set(labels)
+        series = self._series.get(key) or self._new_series(key)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _new_series(self, key: LabelSet) -> List[Number]:
+        series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        return series
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (('le', _format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", labels, series[-2]
+            yield f"{self.name}_count", labels, series[-1]
+
+
+class Collected(Metric):
+    """
+    A metric read from its owner when scraped. `collect` returns a number,
+    a dict of label value -> number for the metric's one label, or None
+    when there's nothing to report.
+    """
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Union[None, Number, Dict[str, Number]]],
+                 type: str = 'gauge', label: Optional[str] = None):
+        super().__init__(name, help)
+        self.type = type
+        self.label = label
+        self._collect = collect
+
+    def samples(self) -> Iterator[Sample]:
+        value = self._collect()
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for label_value, number in value.items():
+                yield self.name, ((self.label, str(label_value)),), number
+        else:
+            yield self.name, (), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Keep the first registration, so a module imported twice doesn't reset its counts
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(str(e))}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labelled: bool = False) -> Counter:
+    return registry.register(Counter(name, help, labelled))
+
+
+def gauge(name: str, help: str, labelled: bool = False) -> Gauge:
+    return registry.register(Gauge(name, help, labelled))
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, labelled: bool = False) -> Histogram:
+    return registry.register(Histogram(name, help, buckets, labelled))
+
+
+def collected(name: str, help: str, collect: Callable, type: str = 'gauge', label: Optional[str] = None) -> Collected:
+    return registry.register(Collected(name, help, collect, type, label))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return registry.render()
+
+
+def resident_memory() -> Optional[int]:
+    """This process's resident set size in bytes, where the platform makes it cheap to read."""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Job outcomes, recorded as they're reported to the relay
+jobs_received = counter('printsalot_jobs_received_total', 'Print jobs received from the relay.')
+jobs_completed = counter('printsalot_jobs_completed_total', 'Print jobs printed successfully.')
+jobs_failed = counter('printsalot_jobs_failed_total', 'Print jobs that failed, by reason.', labelled=True)
+stage_seconds = histogram('printsalot_job_stage_seconds', 'Time spent in each print stage.', labelled=True)
+job_seconds = histogram('printsalot_job_seconds', 'Time from a job being queued to it finishing.')
+
+# Relay connection
+reconnects = counter('printsalot_socketio_reconnects_total', 'Reconnections to the relay after the first connect.')
+ping_rtt = histogram('printsalot_socketio_ping_rtt_seconds', 'Round trip time of acknowledged pings to the relay.',
+                     RTT_BUCKETS)
+
+collected('process_resident_memory_bytes', 'Resident memory size in bytes.', resident_memory)
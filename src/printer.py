@@ -1,107 +1,526 @@
 from escpos.printer import Usb, Dummy
-from escpos.exceptions import USBNotFoundError
-from typing import Optional
+from escpos.exceptions import DeviceNotFoundError, USBNotFoundError
+from escpos.constants import HW_INIT, PAPER_FULL_CUT
+from typing import Dict, List, Optional
 from .config_manager import config_manager
-import base64
-import io
-import requests
+from .decoder import ImageTooLargeError, pixel_budget
+from .fetcher import FetchError, ImageSource
+from .raster import (DEFAULT_BAND_ROWS, DEFAULT_WIDTH, dither, fit_to_printer, open_image, raster_bands,
+                     raster_commands)
+from .raster_cache import CacheEntry, CacheMissError, content_digest, raster_cache
+from .render_pool import render_pool
+from .timing import add_time, timed
+import queue
 import logging
+import threading
+import time
+import numpy as np
 from PIL import Image
 
 logger = logging.getLogger('PrintsAlot.printer')
 
+# Streaming mode: how many bands may be dithered ahead of USB
+BAND_PIPELINE_DEPTH = 2
+
+
 class PaperError(Exception):
     pass
 
-class PrinterWrapper:
+
+class OfflineError(Exception):
+    pass
+
+
+def raster_height(raster: bytes) -> int:
+    """Total rows in a run of GS v 0 raster blocks."""
+    height = 0
+    offset = 0
+    while offset + 8 <= len(raster):
+        width_bytes = int.from_bytes(raster[offset + 4:offset + 6], 'little')
+        rows = int.from_bytes(raster[offset + 6:offset + 8], 'little')
+        height += rows
+        offset += 8 + width_bytes * rows
+    return height
+
+
+def separator_raster(width: int = DEFAULT_WIDTH) -> bytes:
+    """A thin dashed line with blank margins, printed between coalesced jobs."""
+    bits = np.zeros((2 * SEPARATOR_MARGIN_ROWS + SEPARATOR_LINE_ROWS, width), dtype=bool)
+    dashes = np.arange(width) % 16 < 8
+    bits[SEPARATOR_MARGIN_ROWS:SEPARATOR_MARGIN_ROWS + SEPARATOR_LINE_ROWS] = dashes
+    return raster_commands(bits)
+
+
+# Feed past the cutter (ESC d 6), then full cut
+CUT_COMMAND = b'\x1bd\x06' + PAPER_FULL_CUT
+
+# Coalesced jobs: rows of blank paper around a dashed line between stacked
+# images, and the tallest stack printed before an intermediate cut
+SEPARATOR_MARGIN_ROWS = 12
+SEPARATOR_LINE_ROWS = 2
+DEFAULT_COALESCE_HEIGHT = 2000
+
+# USB bulk writes are coalesced into chunks of about this size, rounded
+# down to a multiple of the OUT endpoint's wMaxPacketSize
+DEFAULT_USB_WRITE_SIZE = 16 * 1024
+DEFAULT_USB_PACKET_SIZE = 64
+
+# DLE EOT n real-time status requests
+RT_STATUS_PRINTER = b'\x10\x04\x01'
+RT_STATUS_OFFLINE = b'\x10\x04\x02'
+RT_STATUS_PAPER = b'\x10\x04\x04'
+
+# Status older than this is re-queried before a job instead of trusted
+STATUS_MAX_AGE = 15
+
+_DONE = object()
+
+
+def pipelined(iterable, depth: int = BAND_PIPELINE_DEPTH):
+    """
+    Run an iterator on a helper thread, keeping up to `depth` items ready
+    ahead of the consumer. Exceptions from the producer are re-raised.
+    """
+    items: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+            items.put((_DONE, None))
+        except Exception as e:
+            items.put((_DONE, e))
+
+    producer = threading.Thread(target=produce, name='raster-bands', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        while producer.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+class BulkWriter:
+    """
+    Coalesces ESC/POS commands into large writes aligned to the USB
+    endpoint's packet size, and measures the achieved throughput.
+    """
+
+    def __init__(self, printer, write_size: int, packet_size: int):
+        self.printer = printer
+        self.chunk_size = max(packet_size, write_size // packet_size * packet_size)
+        self.bytes_sent = 0
+        self.writes = 0
+        self.write_time = 0.0
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._send(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+
+    def flush(self):
+        if self._buffer:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_sent / self.write_time if self.write_time else 0.0
+
+    def _send(self, data: bytes):
+        start = time.perf_counter()
+        self.printer._raw(data)
+        self.write_time += time.perf_counter() - start
+        self.bytes_sent += len(data)
+        self.writes += 1
+
+
+def usb_packet_size(printer) -> int:
+    """wMaxPacketSize of a USB printer's bulk OUT endpoint."""
+    if not isinstance(printer, Usb):
+        return DEFAULT_USB_PACKET_SIZE
+    try:
+        import usb.util
+        interface = printer.device.get_active_configuration()[(0, 0)]
+        endpoint = usb.util.find_descriptor(interface, custom_match=lambda e: e.bEndpointAddress == printer.out_ep)
+        return endpoint.wMaxPacketSize
+    except Exception as e:
+        logger.debug(f"Could not read endpoint packet size: {e}")
+        return DEFAULT_USB_PACKET_SIZE
+
+
+class PrinterStatus:
     def __init__(self):
+        self.online = False
+        self.paper_ok = True
+        self.paper_near_end = False
+        self.cover_open = False
+        self.updated_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.online and self.paper_ok and not self.cover_open
+
+    def describe(self) -> str:
+        if not self.online:
+            return "Printer is offline"
+        if self.cover_open:
+            return "Printer cover is open"
+        if not self.paper_ok:
+            return "Printer is out of paper"
+        if self.paper_near_end:
+            return "Paper is running low"
+        return "Printer is ready"
+
+    def as_dict(self) -> dict:
+        return {
+            'online': self.online,
+            'paper_ok': self.paper_ok,
+            'paper_near_end': self.paper_near_end,
+            'cover_open': self.cover_open,
+        }
+
+
+def _usb_id(value) -> int:
+    # Accept "0x04b8" strings from config.json as well as plain ints
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def job_raster(source: ImageSource, writer: Optional[BulkWriter] = None,
+                band_rows: int = DEFAULT_BAND_ROWS, timings: Optional[Dict[str, float]] = None) -> Optional[bytes]:
+    """
+    The ESC/POS raster for a job, from the cache or freshly rendered.
+    Raises CacheMissError if a raster given by key has been evicted.
+    Image bytes are rendered in the process pool when it is enabled;
+    otherwise, with a writer, a fresh render is streamed to it band by band
+    and None is returned, as the whole raster is never held in memory.
+    """
+    width = config_manager.printer_setting('width')
+    mode = config_manager.printer_setting('dither')
+    max_px_height = config_manager.printer_setting('max_px_height')
+
+    if source.raster is not None:
+        # Rendered ahead of time
+        if writer is not None:
+            logger.info(f"Sending {len(source.raster)} bytes of pre-rendered raster data to printer...")
+            writer.write(source.raster)
+        return source.raster
+
+    if source.cache_key:
+        raster = raster_cache.get(source.cache_key)
+        if not raster:
+            raise CacheMissError(f"Raster for {source.url or source.cache_key} is no longer cached")
+        logger.info(f"Raster cache hit for {source.url or source.cache_key}")
+        if writer is not None:
+            logger.info(f"Sending {len(raster)} bytes of raster data to printer...")
+            writer.write(raster)
+        return raster
+
+    if source.image is None and source.data is None:
+        raise FetchError("No valid image found to print")
+
+    digest = source.digest or content_digest(source.data)
+    key = raster_cache.key_for(digest)
+    raster = raster_cache.get(key)
+    if raster:
+        logger.info("Raster cache hit for image content")
+        if writer is not None:
+            logger.info(f"Sending {len(raster)} bytes of raster data to printer...")
+            writer.write(raster)
+    elif source.image is None and render_pool.enabled:
+        raster = render_pool.render(source.data, width, mode, max_px_height, pixel_budget(), timings)
+        if writer is not None:
+            logger.info(f"Sending {len(raster)} bytes of raster data to printer...")
+            writer.write(raster)
+        raster_cache.put(key, raster)
+    else:
+        img = source.image
+        if img is None:
+            with timed(timings, 'decode'):
+                img = open_image(source.data, width)
+        with timed(timings, 'resize'):
+            img = fit_to_printer(img, width, max_px_height)
+        if writer is not None:
+            entry = raster_cache.open_entry(key)
+            try:
+                stream_bands(writer, img, mode, band_rows, timings, entry)
+            except BaseException:
+                if entry is not None:
+                    entry.discard()
+                raise
+            if entry is not None:
+                entry.commit()
+            raster = None
+        else:
+            with timed(timings, 'dither'):
+                raster = raster_commands(dither(img, mode))
+            raster_cache.put(key, raster)
+    if source.url:
+        raster_cache.remember_url(source.url, digest)
+    return raster
+
+
+def stream_bands(writer: BulkWriter, img: Image.Image, mode: str, band_rows: int,
+                 timings: Optional[Dict[str, float]] = None, entry: Optional[CacheEntry] = None):
+    """
+    Dither and send an image band by band, so band N+1 is dithered while
+    band N is written to USB. Each band is also written to the cache
+    `entry`, if given, and then dropped.
+    """
+    logger.info(f"Streaming {img.height} rows to printer in bands of {band_rows}...")
+    bands = 0
+    for band in pipelined(raster_bands(img, mode, band_rows, timings)):
+        writer.write(band)
+        if entry is not None:
+            entry.write(band)
+        bands += 1
+    logger.info(f"Image streamed successfully in {bands} bands.")
+
+
+def prerender(source: ImageSource, timings: Optional[Dict[str, float]] = None) -> ImageSource:
+    """Render a job's raster ahead of printing, so the printer thread only has to send it."""
+    return ImageSource(raster=job_raster(source, timings=timings), url=source.url)
+
+
+class PrinterWrapper:
+    def __init__(self, device: Optional[dict] = None):
+        # Default to TM-T88IV (0x04b8, 0x0202)
+        self.device = device or {}
+        self.name = self.device.get('name', 'printer')
         self.connected = False
         self.printer = None
+        self.status = PrinterStatus()
+        self.write_size = config_manager.get('usb', {}).get('write_size', DEFAULT_USB_WRITE_SIZE)
+        self._packet_size: Optional[int] = None
+
+        # Transfer stats: last job and running totals
+        self.last_transfer: dict = {}
+        self.bytes_sent_total = 0
+        self.write_time_total = 0.0
         self._connect()
 
     def _connect(self):
+        self._packet_size = None
+        if isinstance(self.printer, Usb):
+            # Release the old handle before reopening the device
+            try:
+                self.printer.close()
+            except Exception as e:
+                logger.debug(f"Closing printer {self.name} before reconnecting failed: {e}")
+        if self.device.get('type') == 'simulated':
+            from .sim_printer import create
+            self.printer = create(self.device)
+            self.connected = True
+            logger.info(f"Printer {self.name} is simulated")
+            return
         try:
-            # TODO: Make VID/PID configurable
-            # Default to TM-T88IV (0x04b8, 0x0202)
-            logger.info("Attempting to connect to printer (VID=0x04b8, PID=0x0202)")
-            self.printer = Usb(0x04b8, 0x0202)
+            vid = _usb_id(self.device.get('vid', 0x04b8))
+            pid = _usb_id(self.device.get('pid', 0x0202))
+            # Optional bus/address or serial pick one of several identical printers
+            usb_args = {}
+            for key in ('bus', 'address'):
+                if key in self.device:
+                    usb_args[key] = int(self.device[key])
+            if self.device.get('serial'):
+                usb_args['serial_number'] = self.device['serial']
+
+            logger.info(f"Attempting to connect to printer {self.name} (VID=0x{vid:04x}, PID=0x{pid:04x}, {usb_args})")
+            self.printer = Usb(vid, pid, usb_args=usb_args)
+            # python-escpos opens the device lazily; open it now, so driver detach and
+            # configuration happen here rather than on the first status query or job
+            self.printer.open()
             self.connected = True
-            logger.info("Printer connected via USB")
-        except USBNotFoundError:
-            logger.warning("Printer not found (USB) - using Dummy printer")
+            logger.info(f"Printer {self.name} connected via USB")
+        except (DeviceNotFoundError, USBNotFoundError):
+            logger.warning(f"Printer {self.name} not found (USB) - using Dummy printer")
             self.connected = False
             self.printer = Dummy() # Fallback to dummy for testing UI
         except Exception as e:
-            logger.error(f"Error connecting to printer: {e}", exc_info=True)
+            logger.error(f"Error connecting to printer {self.name}: {e}", exc_info=True)
             self.connected = False
             self.printer = Dummy()
 
-    def print_image(self, content: str, auto_cut: bool = True):
+    def print_image(self, source: ImageSource, auto_cut: bool = True, timings: Optional[Dict[str, float]] = None):
         """
-        Print an image from a URL or Base64 string.
+        Print a job's image: decoded during download, raw bytes, or a
+        cached raster by key. A source URL is remembered for the cache.
+        Stage timings are added to `timings` if given.
         """
         logger.info(f"Processing print job. Auto cut: {auto_cut}")
         try:
-            # Check Paper / Connection by feeding a line
-            if self.connected and not isinstance(self.printer, Dummy):
-                try:
-                    logger.debug("Checking printer connection...")
-                    self.printer.text("\n")
-                except Exception as e:
-                    logger.error(f"Paper check failed: {e}")
-                    raise PaperError("Printer is offline or out of paper")
-
-            img = None
-            
-            # 1. Try as URL
-            if content.startswith('http'):
-                logger.info(f"Downloading image from {content}...")
-                try:
-                    response = requests.get(content, timeout=10)
-                    if response.status_code == 200:
-                        img = Image.open(io.BytesIO(response.content))
-                        logger.info(f"Image downloaded. Size: {img.size}, Mode: {img.mode}")
-                    else:
-                        logger.error(f"Failed to download image. Status: {response.status_code}")
-                except Exception as e:
-                    logger.error(f"Failed to download image: {e}", exc_info=True)
-            
-            # 2. Try as Base64 (Fallback)
-            if not img:
-                try:
-                    logger.info("Trying to decode as Base64...")
-                    # Remove header if present
-                    if ',' in content:
-                        content = content.split(',')[1]
-                    img_data = base64.b64decode(content)
-                    img = Image.open(io.BytesIO(img_data))
-                    logger.info(f"Image decoded from Base64. Size: {img.size}")
-                except Exception as e:
-                    logger.error(f"Failed to decode base64: {e}", exc_info=True)
-
-            if img:
-                # Ensure connected
-                if not self.connected or isinstance(self.printer, Dummy):
-                    logger.info("Reconnecting to printer...")
-                    self._connect()
-                
+            self._check_ready()
+            streaming = config_manager.get('streaming', {})
+            writer = self._open_writer() if streaming.get('enabled', True) else None
+            raster = job_raster(source, writer, streaming.get('band_rows', DEFAULT_BAND_ROWS), timings)
+
+            if writer is None:
+                writer = self._open_writer()
+
                 # Print
-                logger.info("Sending image to printer...")
-                self.printer.image(img)
-                logger.info("Image sent successfully.")
-                
-                if auto_cut:
-                    logger.info("Cutting paper...")
-                    self.printer.cut()
-                    logger.info("Cut command sent.")
-            else:
-                logger.error("No valid image found to print")
-
-        except PaperError:
+                logger.info(f"Sending {len(raster)} bytes of raster data to printer...")
+                writer.write(raster)
+
+            self._finish_output(writer, auto_cut, timings)
+            logger.info("Image sent successfully.")
+
+        except (PaperError, OfflineError, ImageTooLargeError, CacheMissError, FetchError):
             raise # Re-raise for client to handle
         except Exception as e:
             logger.error(f"Error printing image: {e}", exc_info=True)
             # Try to reconnect for next time
             self.connected = False
+            raise
+
+    def print_batch(self, sources: List[ImageSource], auto_cut: bool = True,
+                    max_px_height: int = DEFAULT_COALESCE_HEIGHT,
+                    timings: Optional[List[Dict[str, float]]] = None) -> List[Optional[Exception]]:
+        """
+        Print several jobs back to back as one stream: thin separators
+        between them and a single cut at the end. A stack taller than
+        max_px_height is cut before the job that would overflow it.
+        Returns one entry per source: None if printed, else its error.
+        `timings` holds one dict per source; USB and cut times are the
+        whole stack's.
+        """
+        logger.info(f"Processing {len(sources)} coalesced print jobs. Auto cut: {auto_cut}")
+        timings = timings or [{} for _ in sources]
+        errors: List[Optional[Exception]] = []
+        rasters = []
+        for source, job_timings in zip(sources, timings):
+            try:
+                rasters.append(job_raster(source, timings=job_timings))
+                errors.append(None)
+            except Exception as e:
+                logger.error(f"Skipping job in batch: {e}")
+                errors.append(e)
+        if not rasters:
+            return errors
+
+        try:
+            self._check_ready()
+            writer = self._open_writer()
+            separator = separator_raster(config_manager.printer_setting('width'))
+            stacked = 0
+            for i, raster in enumerate(rasters):
+                height = raster_height(raster)
+                if i:
+                    if stacked + height > max_px_height:
+                        writer.write(CUT_COMMAND)
+                        stacked = 0
+                    else:
+                        writer.write(separator)
+                writer.write(raster)
+                stacked += height
+            stack_timings: Dict[str, float] = {}
+            self._finish_output(writer, auto_cut, stack_timings)
+            for job_timings, error in zip(timings, errors):
+                if error is None:
+                    job_timings.update(stack_timings)
+            logger.info(f"{len(rasters)} images sent successfully.")
+        except (PaperError, OfflineError, ImageTooLargeError):
+            raise
+        except Exception as e:
+            logger.error(f"Error printing batch: {e}", exc_info=True)
+            self.connected = False
+            raise
+        return errors
+
+    def _finish_output(self, writer: BulkWriter, auto_cut: bool, timings: Optional[Dict[str, float]] = None):
+        """Cut if asked, send what's left and record the transfer. The cut's time includes the final flush."""
+        sent = writer.write_time
+        if auto_cut:
+            logger.info("Cutting paper...")
+            writer.write(CUT_COMMAND)
+        writer.flush()
+        add_time(timings, 'usb', sent)
+        add_time(timings, 'cut' if auto_cut else 'usb', writer.write_time - sent)
+        self._record_transfer(writer)
+
+    def _check_ready(self):
+        """
+        Check Paper / Connection from the last real-time status. A printer
+        that was disconnected is reconnected and queried first.
+        """
+        status = self.status
+        if (not self.connected or status.updated_at is None
+                or time.monotonic() - status.updated_at > STATUS_MAX_AGE):
+            status = self.poll_status()
+        if not status.online:
+            logger.error(f"Connection check failed: {status.describe()}")
+            raise OfflineError(status.describe())
+        if not status.ready:
+            logger.error(f"Paper check failed: {status.describe()}")
+            raise PaperError(status.describe())
+
+    def poll_status(self) -> PrinterStatus:
+        """
+        Query the printer's real-time status (DLE EOT 1, 2 and 4).
+        Must be called on the printer thread.
+        """
+        self._ensure_connected()
+        status = PrinterStatus()
+        if self.connected and not isinstance(self.printer, Dummy):
+            try:
+                printer_byte = self._query_status(RT_STATUS_PRINTER)
+                offline_byte = self._query_status(RT_STATUS_OFFLINE)
+                paper_byte = self._query_status(RT_STATUS_PAPER)
+                status.online = not printer_byte & 0x08
+                status.cover_open = bool(offline_byte & 0x04)
+                status.paper_near_end = paper_byte & 0x0C == 0x0C
+                status.paper_ok = not (paper_byte & 0x60 == 0x60 or offline_byte & 0x20)
+            except Exception as e:
+                logger.warning(f"Status query failed: {e}")
+                self.connected = False
+        status.updated_at = time.monotonic()
+        self.status = status
+        return status
+
+    def _query_status(self, command: bytes) -> int:
+        self.printer._raw(command)
+        response = self.printer._read()
+        if not response:
+            raise IOError(f"No response to status query {command!r}")
+        return response[0]
+
+    def _ensure_connected(self):
+        if not self.connected or isinstance(self.printer, Dummy):
+            logger.info("Reconnecting to printer...")
+            self._connect()
+
+    def _open_writer(self) -> BulkWriter:
+        """Start a job's output: a coalescing writer primed with printer init."""
+        self._ensure_connected()
+        if self._packet_size is None:
+            self._packet_size = usb_packet_size(self.printer)
+        writer = BulkWriter(self.printer, self.write_size, self._packet_size)
+        writer.write(HW_INIT)
+        return writer
 
-printer_wrapper = PrinterWrapper()
+    def _record_transfer(self, writer: BulkWriter):
+        self.bytes_sent_total += writer.bytes_sent
+        self.write_time_total += writer.write_time
+        self.last_transfer = {
+            'bytes': writer.bytes_sent,
+            'writes': writer.writes,
+            'seconds': writer.write_time,
+            'bytes_per_sec': writer.bytes_per_sec,
+        }
+        logger.info(
+            f"USB transfer: {writer.bytes_sent} bytes in {writer.writes} writes "
+            f"of up to {writer.chunk_size}, {writer.write_time:.3f}s ({writer.bytes_per_sec / 1024:.1f} KiB/s)"
+        )
@@ -0,0 +1,181 @@
+"""
+Image to ESC/POS raster conversion for PrintsAlot.
+Decodes image bytes, scales them to the printer width, dithers them to
+1-bit and packs GS v 0 raster blocks. Depends only on Pillow and NumPy,
+so render pool worker processes can import it without the rest of the app.
+"""
+import io
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from .decoder import pixel_budget, prepare_decode
+from .timing import timed
+
+logger = logging.getLogger('PrintsAlot.printer')
+
+DEFAULT_WIDTH = 384
+DEFAULT_DITHER = 'floyd'
+DEFAULT_MAX_PX_HEIGHT = 2000
+DITHER_MODES = ('threshold', 'bayer', 'floyd')
+
+# GS v 0 heights are limited by the printer's receive buffer, so tall images
+# are sent as several raster blocks (same default as python-escpos)
+RASTER_FRAGMENT_HEIGHT = 960
+
+# Rows per band when a raster is streamed to the printer while it is dithered
+DEFAULT_BAND_ROWS = 256
+
+# 8x8 Bayer matrix scaled to 0-255 thresholds
+_BAYER_8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32)
+_BAYER_THRESHOLDS = ((_BAYER_8 + 0.5) * (256 / 64)).astype(np.uint8)
+
+
+def to_grayscale(img: Image.Image, width: int) -> Image.Image:
+    """
+    Flatten transparency onto white, convert to 8-bit grayscale and
+    scale down to the printer width (narrower images print at native size).
+    """
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    elif img.mode == '1':
+        img = img.convert('L')
+    elif img.mode.startswith('I'):
+        # 16-bit grayscale PNGs ('I;16', or 'I' from older Pillow): scale to
+        # 8 bits, since convert('L') would clip everything above 255 to white
+        img = img.convert('I').point(lambda value: value / 256).convert('L')
+
+    # Cheap integer box reduction first, so the costly steps below run
+    # on roughly printer-sized pixels rather than the full-size image
+    if img.width >= 2 * width:
+        img = img.reduce(img.width // width)
+
+    if img.mode in ('RGBA', 'LA'):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    img = img.convert('L')
+
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        img = img.resize((width, height), Image.Resampling.BILINEAR)
+    return img
+
+
+def fit_to_printer(img: Image.Image, width: int = DEFAULT_WIDTH, max_px_height: int = DEFAULT_MAX_PX_HEIGHT) -> Image.Image:
+    """Convert a decoded image to printer-ready grayscale, clamped to max_px_height rows."""
+    source_size = img.size
+    img = to_grayscale(img, width)
+    if img.height > max_px_height:
+        img = img.crop((0, 0, img.width, max_px_height))
+    logger.info(f"Image prepared. Decoded size: {source_size}, printed size: {img.size}")
+    return img
+
+
+def open_image(image_data: bytes, width: int = DEFAULT_WIDTH, max_pixels: Optional[int] = None) -> Image.Image:
+    """
+    Decode image bytes. JPEGs are decoded at reduced resolution close to
+    the printer width (DCT scaling), and images over max_pixels are
+    rejected before decoding.
+    """
+    img = Image.open(io.BytesIO(image_data))
+    prepare_decode(img, width, max_pixels or pixel_budget())
+    img.load()
+    return img
+
+
+def decode_image(image_data: bytes, width: int = DEFAULT_WIDTH, max_px_height: int = DEFAULT_MAX_PX_HEIGHT,
+                 max_pixels: Optional[int] = None) -> Image.Image:
+    """Decode image bytes to printer-ready grayscale."""
+    return fit_to_printer(open_image(image_data, width, max_pixels), width, max_px_height)
+
+
+def dither(img: Image.Image, mode: str = DEFAULT_DITHER, top: int = 0) -> np.ndarray:
+    """
+    Reduce a grayscale image to a 1-bit array where True means a black dot.
+    `top` is the row the image starts at when it is a band of a taller image,
+    so the Bayer pattern lines up across bands.
+    """
+    if mode == 'floyd':
+        # Pillow's error diffusion runs in C; only the result goes through NumPy
+        return ~np.asarray(img.convert('1', dither=Image.Dither.FLOYDSTEINBERG))
+
+    pixels = np.asarray(img, dtype=np.uint8)
+    if mode == 'bayer':
+        h, w = pixels.shape
+        rows = (np.arange(h) + top) % 8
+        cols = np.arange(w) % 8
+        return pixels < _BAYER_THRESHOLDS[rows[:, None], cols]
+
+    if mode != 'threshold':
+        logger.warning(f"Unknown dither mode '{mode}', using threshold")
+    return pixels < 128
+
+
+def raster_commands(bits: np.ndarray, fragment_height: int = RASTER_FRAGMENT_HEIGHT) -> bytes:
+    """
+    Pack a 1-bit array into ESC/POS GS v 0 raster blocks.
+    """
+    packed = np.packbits(bits, axis=1)
+    return raster_rows(packed, 0, len(packed), fragment_height)
+
+
+def raster_rows(packed: np.ndarray, top: int, height: int,
+                fragment_height: int = RASTER_FRAGMENT_HEIGHT) -> bytes:
+    """
+    The slice of raster_commands() output covering packed rows that start at
+    row `top` of an image `height` rows tall, block headers included.
+    Consecutive slices join up to exactly the unsliced raster.
+    """
+    width_bytes = packed.shape[1]
+    out = bytearray()
+    start = 0
+    while start < len(packed):
+        row = top + start
+        if row % fragment_height == 0:
+            block_rows = min(fragment_height, height - row)
+            out += b'\x1dv0\x00' + width_bytes.to_bytes(2, 'little') + block_rows.to_bytes(2, 'little')
+        end = min(len(packed), start + fragment_height - row % fragment_height)
+        out += packed[start:end].tobytes()
+        start = end
+    return bytes(out)
+
+
+def raster_bands(img: Image.Image, mode: str = DEFAULT_DITHER, band_rows: int = DEFAULT_BAND_ROWS,
+                 timings: Optional[Dict[str, float]] = None):
+    """
+    Yield a grayscale image's raster `band_rows` rows at a time. The bands
+    join up to exactly raster_commands(dither(img, mode)).
+    Floyd-Steinberg carries error from each row into the next, so it is
+    dithered in one pass (a few ms at printer width) and only packed per
+    band; the other modes dither each band on its own.
+    """
+    band_rows = max(1, band_rows)
+    if mode == 'floyd':
+        with timed(timings, 'dither'):
+            packed = np.packbits(dither(img, mode), axis=1)
+        for top in range(0, img.height, band_rows):
+            yield raster_rows(packed[top:top + band_rows], top, img.height)
+        return
+    for top in range(0, img.height, band_rows):
+        with timed(timings, 'dither'):
+            band = img.crop((0, top, img.width, min(top + band_rows, img.height)))
+            block = raster_rows(np.packbits(dither(band, mode, top), axis=1), top, img.height)
+        yield block
+
+
+def render_raster(image_data: bytes, width: int = DEFAULT_WIDTH, mode: str = DEFAULT_DITHER,
+                  max_px_height: int = DEFAULT_MAX_PX_HEIGHT, max_pixels: Optional[int] = None) -> bytes:
+    """Convert image bytes into ready-to-send ESC/POS raster bytes."""
+    return raster_commands(dither(decode_image(image_data, width, max_px_height, max_pixels), mode))
@@ -0,0 +1,295 @@
+"""
+On-disk LRU cache of finished printer rasters for PrintsAlot.
+Rasters are content-addressed by the hash of the source image bytes plus
+the render settings, so repeat prints skip download, decode and dithering.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from . import metrics
+from .config_manager import config_manager
+
+logger = logging.getLogger('PrintsAlot.cache')
+
+DEFAULT_MAX_MB = 64
+
+# Seconds a URL from any other host is trusted to serve the bytes it served last
+DEFAULT_URL_TTL = 600
+
+# Discord CDN links carry expiring signature params that change between
+# shares of the same attachment; they don't identify the content
+_VOLATILE_URL_PARAMS = {'ex', 'is', 'hm'}
+
+# Hosts whose URLs name one immutable upload, so a URL always serves the same bytes
+_CONTENT_ADDRESSED_HOSTS = {'cdn.discordapp.com', 'media.discordapp.net'}
+
+
+class CacheMissError(Exception):
+    """A raster a job was given by key is no longer cached, e.g. evicted while the job waited."""
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class RasterCache:
+    """
+    Size-capped LRU of packed ESC/POS rasters stored as one file per entry.
+
+    `<key>.bin` files hold raster bytes ready to send; `<hash>.url` files
+    map a source URL to the digest of the bytes it served and when, so a
+    cached URL doesn't need to be downloaded again. Discord CDN URLs are
+    trusted until evicted; other URLs for `url_ttl` seconds, as their
+    content may change.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, enabled: bool = True,
+                 url_ttl: float = DEFAULT_URL_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.url_ttl = url_ttl
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # filename -> size, oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled:
+            self._scan()
+
+    @staticmethod
+    def make_key(digest: str, width: int, dither: str, max_px_height: int) -> str:
+        settings = f"{digest}:{width}:{dither}:{max_px_height}"
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def key_for(self, digest: str) -> str:
+        """Cache key for a source digest under the current printer settings."""
+        return self.make_key(
+            digest,
+            config_manager.printer_setting('width'),
+            config_manager.printer_setting('dither'),
+            config_manager.printer_setting('max_px_height'),
+        )
+
+    def contains(self, key: str) -> bool:
+        """Check for a raster without reading it, marking it recently used."""
+        with self._lock:
+            if f"{key}.bin" not in self._entries:
+                return False
+            self._entries.move_to_end(f"{key}.bin")
+            return True
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """Return the source digest last seen for this URL, if known and still trusted."""
+        if not self._trusts_url(url):
+            return None
+        content_addressed = urlsplit(url).hostname in _CONTENT_ADDRESSED_HOSTS
+        data = self._read(self._url_name(url))
+        if not data:
+            return None
+        digest, _, seen_at = data.decode().partition(' ')
+        if not content_addressed:
+            try:
+                if time.time() - float(seen_at) > self.url_ttl:
+                    return None
+            except ValueError:
+                return None
+        return digest
+
+    def remember_url(self, url: str, digest: str):
+        if self._trusts_url(url):
+            self._write(self._url_name(url), f"{digest} {time.time():.0f}".encode())
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        raster = self._read(f"{key}.bin")
+        with self._lock:
+            if raster is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return raster
+
+    def put(self, key: str, raster: bytes):
+        if self.enabled:
+            self._write(f"{key}.bin", raster)
+
+    def open_entry(self, key: str) -> Optional['CacheEntry']:
+        """A raster entry to write piece by piece, or None if the cache is disabled."""
+        return CacheEntry(self, f"{key}.bin") if self.enabled else None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _trusts_url(self, url: str) -> bool:
+        return self.enabled and (self.url_ttl > 0 or urlsplit(url).hostname in _CONTENT_ADDRESSED_HOSTS)
+
+    def _url_name(self, url: str) -> str:
+        parts = urlsplit(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k not in _VOLATILE_URL_PARAMS]
+        normalized = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+        return f"{hashlib.sha256(normalized.encode()).hexdigest()}.url"
+
+    def _scan(self):
+        """Rebuild the LRU order from the files on disk (oldest mtime first)."""
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(('.bin', '.url')):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        logger.info(f"Raster cache: {len(self._entries)} entries, {self._size} bytes")
+        with self._lock:
+            self._evict()
+
+    def _read(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Persist recency so the LRU order survives restarts
+            os.utime(path)
+            return data
+        except OSError as e:
+            logger.warning(f"Dropping unreadable cache entry {name}: {e}")
+            with self._lock:
+                self._remove(name)
+            return None
+
+    def _write(self, name: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {name}: {e}")
+            return
+        self._added(name, len(data))
+
+    def _added(self, name: str, size: int):
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            name = next(iter(self._entries))
+            self._remove(name)
+            self.evictions += 1
+
+    def _remove(self, name: str):
+        self._size -= self._entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+
+class CacheEntry:
+    """
+    A raster written to the cache as it is produced, so a streamed job
+    never holds its whole raster in memory. It only becomes visible on
+    commit(); one that outgrows the cache is dropped.
+    """
+
+    def __init__(self, cache: RasterCache, name: str):
+        self._cache = cache
+        self._name = name
+        self._path = os.path.join(cache.directory, name)
+        self._file = None
+        self._size = 0
+        self._dropped = False
+
+    def write(self, data: bytes):
+        if self._dropped:
+            return
+        self._size += len(data)
+        if self._size > self._cache.max_bytes:
+            self.discard()
+            return
+        try:
+            if self._file is None:
+                os.makedirs(self._cache.directory, exist_ok=True)
+                self._file = open(f"{self._path}.tmp", 'wb')
+            self._file.write(data)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {self._name}: {e}")
+            self.discard()
+
+    def commit(self):
+        if self._dropped or self._file is None:
+            return
+        try:
+            self._file.close()
+            os.replace(f"{self._path}.tmp", self._path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {self._name}: {e}")
+            self.discard()
+            return
+        self._file = None
+        self._cache._added(self._name, self._size)
+
+    def discard(self):
+        self._dropped = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(f"{self._path}.tmp")
+            except OSError:
+                pass
+
+
+_cache_settings = config_manager.get('cache', {})
+raster_cache = RasterCache(
+    os.path.join(config_manager.directory, 'raster_cache'),
+    int(_cache_settings.get('max_mb', DEFAULT_MAX_MB) * 1024 * 1024),
+    enabled=_cache_settings.get('enabled', True),
+    url_ttl=_cache_settings.get('url_ttl', DEFAULT_URL_TTL),
+)
+
+metrics.collected('printsalot_raster_cache_hits_total', 'Raster cache lookups that found a raster.',
+                  lambda: raster_cache.hits, type='counter')
+metrics.collected('printsalot_raster_cache_misses_total', 'Raster cache lookups that had to render.',
+                  lambda: raster_cache.misses, type='counter')
+metrics.collected('printsalot_raster_cache_hit_ratio', 'Share of raster cache lookups that were hits.',
+                  lambda: raster_cache.stats()['hit_ratio'])
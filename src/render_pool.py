@@ -0,0 +1,94 @@
+"""
+Process pool for the CPU-heavy print stages in PrintsAlot.
+Decoding, resizing and dithering run in worker processes so they don't hold
+the GIL against the web UI and the Socket.IO loop. Finished rasters come
+back through shared memory rather than being pickled.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+from .config_manager import config_manager
+from .timing import add_time
+
+logger = logging.getLogger('PrintsAlot.render')
+
+# Off unless configured: rendering in the pool replaces band streaming and
+# decoding during the download, so it delays the first bytes reaching the printer
+DEFAULT_PROCESSES = 0
+# With "processes": "auto", cores left to the event loop, printer threads and everything else
+RESERVED_CORES = 1
+
+# GS v 0 block header size
+_BLOCK_HEADER = 8
+
+
+def configured_processes(setting) -> int:
+    """Worker count for the `render.processes` setting: a number, or "auto" for one per spare core."""
+    if setting == 'auto':
+        return max(1, (os.cpu_count() or 2) - RESERVED_CORES)
+    try:
+        return max(0, int(setting))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid render.processes {setting!r}, rendering on threads")
+        return 0
+
+
+def max_raster_size(width: int, max_px_height: int) -> int:
+    """Upper bound on a packed raster's size for the given settings."""
+    from .raster import RASTER_FRAGMENT_HEIGHT
+    blocks = -(-max_px_height // RASTER_FRAGMENT_HEIGHT)
+    return (width + 7) // 8 * max_px_height + _BLOCK_HEADER * blocks
+
+
+class RenderPool:
+    """
+    Lazily started ProcessPoolExecutor. The caller allocates the shared
+    memory for each raster and keeps it open until the raster is read
+    back, so the block outlives the worker's handle on every platform.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def render(self, data: bytes, width: int, mode: str, max_px_height: int, max_pixels: int,
+               timings: Optional[Dict[str, float]] = None) -> bytes:
+        """Render image bytes to a packed raster in a worker process. Blocks the calling thread."""
+        # Imported only once the pool is used: it loads Pillow and NumPy
+        from . import render_worker
+        shm = shared_memory.SharedMemory(create=True, size=max_raster_size(width, max_px_height))
+        try:
+            future = self._get_executor().submit(render_worker.render, bytes(data), width, mode, max_px_height,
+                                                 max_pixels, shm.name)
+            length, worker_timings = future.result()
+            for stage, seconds in worker_timings.items():
+                add_time(timings, stage, seconds)
+            return bytes(shm.buf[:length])
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting render pool with {self.processes} processes")
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self._executor
+
+
+render_pool = RenderPool(configured_processes(config_manager.get('render', {}).get('processes', DEFAULT_PROCESSES)))
@@ -0,0 +1,34 @@
+"""
+Render pool worker entry point for PrintsAlot.
+Pool processes import this module to run their task. It only needs Pillow,
+NumPy and the raster code, so a spawned worker starts quickly and never
+loads the web UI, the relay client, the job journal or the config.
+"""
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+from .raster import dither, fit_to_printer, open_image, raster_commands
+from .timing import timed
+
+
+def render(data: bytes, width: int, mode: str, max_px_height: int, max_pixels: int,
+           shm_name: str) -> Tuple[int, Dict[str, float]]:
+    """
+    Decode, resize and dither image bytes, writing the raster into the
+    caller's shared memory block. Returns its length and the timings.
+    """
+    timings: Dict[str, float] = {}
+    with timed(timings, 'decode'):
+        img = open_image(data, width, max_pixels)
+    with timed(timings, 'resize'):
+        img = fit_to_printer(img, width, max_px_height)
+    with timed(timings, 'dither'):
+        raster = raster_commands(dither(img, mode))
+
+    # Pool workers share the parent's resource tracker, which already tracks this block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        shm.buf[:len(raster)] = raster
+    finally:
+        shm.close()
+    return len(raster), timings
@@ -0,0 +1,247 @@
+"""
+Simulated USB thermal printer for PrintsAlot.
+Parses the ESC/POS stream the receiver sends, models USB bandwidth and
+print-head speed, answers DLE EOT status queries and times each job, so
+the print path can be benchmarked without a TM-T88IV attached.
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from escpos.escpos import Escpos
+
+logger = logging.getLogger('PrintsAlot.simulator')
+
+# TM-T88IV-like defaults
+DEFAULT_USB_KBPS = 1000  # effective USB full-speed bulk throughput, KiB/s
+DEFAULT_HEAD_MM_PER_S = 150
+DEFAULT_DPI = 180
+DEFAULT_BUFFER_KB = 4  # receive buffer
+DEFAULT_CUT_SECONDS = 0.3
+DEFAULT_PAPER_M = 80  # roll length
+LINE_FEED_MM = 25.4 / 6  # default line spacing, 1/6"
+PAPER_NEAR_END = 0.1  # fraction of the roll left when the near-end sensor trips
+
+MM_PER_INCH = 25.4
+
+
+class SimulatedPrinter(Escpos):
+    """
+    An escpos printer whose `_raw` consumes ESC/POS like the real device:
+    each write costs its USB transfer time, and blocks while the receive
+    buffer is full of rows the head hasn't printed yet. With
+    realtime=False nothing sleeps; the modelled times are only recorded.
+    """
+
+    def __init__(self, usb_kbps: float = DEFAULT_USB_KBPS, head_mm_per_s: float = DEFAULT_HEAD_MM_PER_S,
+                 dpi: int = DEFAULT_DPI, buffer_kb: float = DEFAULT_BUFFER_KB,
+                 cut_seconds: float = DEFAULT_CUT_SECONDS, paper_m: float = DEFAULT_PAPER_M,
+                 realtime: bool = True, **kwargs):
+        Escpos.__init__(self, **kwargs)
+        self.usb_bytes_per_sec = usb_kbps * 1024
+        self.head_mm_per_s = head_mm_per_s
+        self.dots_per_mm = dpi / MM_PER_INCH
+        self.buffer_bytes = int(buffer_kb * 1024)
+        self.cut_seconds = cut_seconds
+        self.paper_total_mm = paper_m * 1000
+        self.paper_left_mm = self.paper_total_mm
+        self.realtime = realtime
+
+        self.online = True
+        self.cover_open = False
+        self.jobs: List[Dict[str, Any]] = []  # finished jobs, see _new_job()
+
+        self._stream = bytearray()
+        self._responses: deque = deque()
+        self._clock = time.monotonic()  # modelled "now" when not realtime
+        self._head_free_at = self._now()  # when the mechanism finishes what it has
+        self._write_started = self._head_free_at
+        self._job = self._new_job()
+
+    # escpos transport
+
+    def _raw(self, msg: bytes):
+        transfer = len(msg) / self.usb_bytes_per_sec
+        self._write_started = self._now()
+        self._wait(transfer)
+        self._job['bytes'] += len(msg)
+        self._job['writes'] += 1
+        self._job['usb_seconds'] += transfer
+        self._stream += msg
+        self._parse()
+
+    def _read(self) -> bytes:
+        return self._responses.popleft() if self._responses else b''
+
+    def close(self):
+        pass
+
+    # State for tests and benchmarks
+
+    def refill(self):
+        self.paper_left_mm = self.paper_total_mm
+
+    def stats(self) -> Dict[str, Any]:
+        printed = [job for job in self.jobs if job['rows']]
+        return {
+            'jobs': len(self.jobs),
+            'bytes': sum(job['bytes'] for job in self.jobs),
+            'rows': sum(job['rows'] for job in self.jobs),
+            'cuts': sum(job['cuts'] for job in self.jobs),
+            'paper_left_mm': round(self.paper_left_mm, 1),
+            'avg_job_seconds': sum(job['seconds'] for job in printed) / len(printed) if printed else 0.0,
+        }
+
+    # Command parsing
+
+    def _parse(self):
+        stream = self._stream
+        pos = 0
+        while pos < len(stream):
+            used = self._command(stream, pos)
+            if used == 0:
+                break  # command continues in the next write
+            pos += used
+        del stream[:pos]
+
+    def _command(self, stream: bytearray, pos: int) -> int:
+        """Handle the command at `pos`. Returns the bytes it used, or 0 if it's incomplete."""
+        available = len(stream) - pos
+        byte = stream[pos]
+        if byte == 0x1d:  # GS
+            if available < 2:
+                return 0
+            if stream[pos + 1] == ord('v'):  # GS v 0 m xL xH yL yH d1...dk
+                if available < 8:
+                    return 0
+                width_bytes = stream[pos + 4] | stream[pos + 5] << 8
+                rows = stream[pos + 6] | stream[pos + 7] << 8
+                size = 8 + width_bytes * rows
+                if available < size:
+                    return 0
+                self._raster(width_bytes, rows)
+                return size
+            if stream[pos + 1] == ord('V'):  # GS V m, or GS V m n for m = 65/66
+                if available < 3:
+                    return 0
+                size = 4 if stream[pos + 2] in (65, 66) else 3
+                if available < size:
+                    return 0
+                self._cut()
+                return size
+            return 2
+        if byte == 0x1b:  # ESC
+            if available < 2:
+                return 0
+            if stream[pos + 1] == ord('@'):
+                self._init()
+                return 2
+            if stream[pos + 1] == ord('d'):  # ESC d n: feed n lines
+                if available < 3:
+                    return 0
+                self._feed(stream[pos + 2] * LINE_FEED_MM)
+                return 3
+            return 2
+        if byte == 0x10:  # DLE
+            if available < 3:
+                return 0
+            if stream[pos + 1] == 0x04:  # DLE EOT n: real-time status
+                self._responses.append(bytes([self._status(stream[pos + 2])]))
+            return 3
+        if byte == 0x0a:  # LF
+            self._feed(LINE_FEED_MM)
+        return 1
+
+    # Mechanism model
+
+    def _init(self):
+        # A job starts at ESC @; one that ended without a cut finishes at the next
+        if self._job['rows']:
+            self._finish_job()
+        if self._job['started_at'] is None:
+            self._job['started_at'] = self._write_started
+
+    def _raster(self, width_bytes: int, rows: int):
+        mm = rows / self.dots_per_mm
+        self._run_head(mm / self.head_mm_per_s, width_bytes * rows)
+        self._job['rows'] += rows
+        self.paper_left_mm = max(0.0, self.paper_left_mm - mm)
+
+    def _feed(self, mm: float):
+        self._run_head(mm / self.head_mm_per_s, 0)
+        self.paper_left_mm = max(0.0, self.paper_left_mm - mm)
+
+    def _cut(self):
+        self._run_head(self.cut_seconds, 0)
+        self._job['cuts'] += 1
+        self._finish_job()
+
+    def _run_head(self, seconds: float, size: int):
+        """
+        Queue mechanism work. The host is held back once more than the
+        receive buffer's worth of data is waiting to be printed.
+        """
+        now = self._now()
+        self._head_free_at = max(self._head_free_at, now) + seconds
+        self._job['print_seconds'] += seconds
+        if size and seconds:
+            buffered_seconds = seconds * min(1.0, self.buffer_bytes / size)
+            stall = self._head_free_at - now - buffered_seconds
+            if stall > 0:
+                self._job['stall_seconds'] += stall
+                self._wait(stall)
+
+    def _status(self, n: int) -> int:
+        # Bits 1 and 4 are fixed to 1 in every status byte
+        if n == 1:
+            return 0x12 | (0 if self.online else 0x08)
+        if n == 2:
+            paper_out = self.paper_left_mm <= 0
+            return 0x12 | (0x04 if self.cover_open else 0) | (0x20 if paper_out else 0)
+        if n == 4:
+            status = 0x12
+            if self.paper_left_mm <= self.paper_total_mm * PAPER_NEAR_END:
+                status |= 0x0C
+            if self.paper_left_mm <= 0:
+                status |= 0x60
+            return status
+        return 0x12
+
+    # Jobs and time
+
+    @staticmethod
+    def _new_job() -> Dict[str, Any]:
+        return {
+            'started_at': None, 'bytes': 0, 'writes': 0, 'rows': 0, 'cuts': 0,
+            'usb_seconds': 0.0, 'print_seconds': 0.0, 'stall_seconds': 0.0, 'seconds': 0.0,
+        }
+
+    def _finish_job(self):
+        job = self._job
+        if job['started_at'] is not None:
+            # Until the paper is out of the cutter, not just until the last byte was sent
+            job['seconds'] = max(self._head_free_at, self._now()) - job['started_at']
+        self.jobs.append(job)
+        logger.info(
+            f"Simulated job: {job['bytes']} bytes in {job['writes']} writes, {job['rows']} rows, "
+            f"usb {job['usb_seconds']:.3f}s, head {job['print_seconds']:.3f}s, "
+            f"stalled {job['stall_seconds']:.3f}s, done in {job['seconds']:.3f}s"
+        )
+        self._job = self._new_job()
+
+    def _now(self) -> float:
+        return time.monotonic() if self.realtime else self._clock
+
+    def _wait(self, seconds: float):
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            self._clock += seconds
+
+
+def create(device: Optional[dict] = None) -> SimulatedPrinter:
+    """A simulated printer configured from a `printers` entry (or defaults)."""
+    settings = {key: value for key, value in (device or {}).items()
+                if key in ('usb_kbps', 'head_mm_per_s', 'dpi', 'buffer_kb', 'cut_seconds', 'paper_m', 'realtime')}
+    return SimulatedPrinter(**settings)
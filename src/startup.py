@@ -0,0 +1,125 @@
+"""
+Startup profiling for PrintsAlot.
+Records when each startup phase finishes and, with --profile-startup,
+how long each module took to import, then prints the breakdown once the
+receiver is fully up. Imported first by app.py, so it only uses the
+standard library.
+"""
+import asyncio
+import builtins
+import importlib.util
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger('PrintsAlot.startup')
+
+# Phases reported in this order; the report waits for all of them, up to REPORT_TIMEOUT
+PHASES = ('config', 'imports', 'server', 'first_page', 'socket_connect', 'printer_ready')
+REPORT_TIMEOUT = 60.0
+TOP_IMPORTS = 15
+
+
+class ImportTimer:
+    """
+    Times first imports made through `import` statements. Each module is
+    charged its own time; modules it imports for the first time are
+    charged separately. Third-party packages are grouped by top-level name.
+    """
+
+    def __init__(self):
+        self.times: Dict[str, float] = {}
+        self._local = threading.local()  # per-thread stack of [module, start, time in nested first imports]
+        self._import = builtins.__import__
+
+    def install(self):
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if builtins.__import__ == self._timed_import:
+            builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = self._new_module(name, globals, fromlist, level)
+        if module is None:
+            return self._import(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault('stack', [])
+        frame = [module, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            key = module if module.startswith('src.') else module.split('.')[0]
+            self.times[key] = self.times.get(key, 0.0) + elapsed - frame[2]
+            if stack:
+                stack[-1][2] += elapsed
+
+    @staticmethod
+    def _new_module(name, globals, fromlist, level) -> Optional[str]:
+        """The module this import statement loads for the first time, if any."""
+        try:
+            resolved = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__')) \
+                if level else name
+        except (ImportError, ValueError):
+            return None
+        package = sys.modules.get(resolved)
+        if package is None:
+            return resolved
+        # `from package import submodule`
+        if hasattr(package, '__path__'):
+            for item in fromlist or ():
+                if item != '*' and not hasattr(package, item):
+                    return f"{resolved}.{item}"
+        return None
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        # Not in render pool workers, which re-run the main module on spawn
+        self.enabled = '--profile-startup' in sys.argv and multiprocessing.parent_process() is None
+        self.imports: Optional[ImportTimer] = None
+        self._reported = False
+        if self.enabled:
+            self.imports = ImportTimer()
+            self.imports.install()
+
+    def mark(self, phase: str):
+        """Record that a phase finished. Only its first completion counts."""
+        if phase not in self.phases:
+            self.phases[phase] = time.perf_counter() - self.started
+            logger.info(f"Startup: {phase} after {self.phases[phase]:.3f}s")
+            if self.enabled and all(p in self.phases for p in PHASES):
+                self.report()
+
+    async def report_after_timeout(self):
+        """Report whatever was reached if some phase never completes, e.g. with no relay."""
+        await asyncio.sleep(REPORT_TIMEOUT)
+        self.report()
+
+    def report(self):
+        """Print the phase timings and the slowest imports."""
+        if self._reported:
+            return
+        self._reported = True
+        lines = ["Startup profile (seconds since launch):"]
+        for phase in PHASES:
+            at = self.phases.get(phase)
+            lines.append(f"  {phase:<16}{'not reached' if at is None else f'{at:8.3f}'}")
+        if self.imports:
+            self.imports.uninstall()
+            lines.append(f"Slowest imports ({sum(self.imports.times.values()):.3f}s in total):")
+            slowest = sorted(self.imports.times.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+            lines.extend(f"  {module:<32}{seconds:8.3f}" for module, seconds in slowest)
+        report = '\n'.join(lines)
+        print(report, file=sys.stderr, flush=True)
+        logger.info(report)
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,76 @@
+"""
+Printer status monitor for PrintsAlot.
+Polls the printer's real-time status on a timer so the job path can check
+paper and cover state instantly, and reports changes to listeners.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from .config_manager import config_manager
+from .jobs import print_queue
+
+logger = logging.getLogger('PrintsAlot.status')
+
+DEFAULT_INTERVAL = 5
+
+
+class StatusMonitor:
+    def __init__(self):
+        self.interval = config_manager.get('status', {}).get('interval', DEFAULT_INTERVAL)
+        self.status: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_change: Optional[Callable[[dict], Awaitable[None]]] = None
+
+    def on_change(self, callback: Callable[[dict], Awaitable[None]]):
+        """Set a coroutine called as callback(status) whenever the printer status changes."""
+        self._on_change = callback
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                status = await self.poll()
+                if status != self.status:
+                    logger.info(f"Printer status changed: {status}")
+                    self.status = status
+                    if self._on_change:
+                        await self._on_change(status)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Status poll failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def poll(self) -> dict:
+        """
+        Poll every printer in the pool, updating its health, and return the
+        combined status: top-level fields describe the best available printer.
+        """
+        workers = print_queue.workers
+        # Each poll waits behind its own printer's current job, so poll them concurrently
+        results = await asyncio.gather(*(worker.run(self._poll, worker) for worker in workers))
+        printers = []
+        for worker, status in zip(workers, results):
+            print_queue.set_health(worker, status['ready'])
+            printers.append({'name': worker.name, **status})
+
+        best = next((p for p in printers if p['ready']), printers[0])
+        combined = {key: best[key] for key in ('online', 'paper_ok', 'paper_near_end', 'cover_open')}
+        combined['printers'] = printers
+        return combined
+
+    @staticmethod
+    def _poll(worker) -> dict:
+        printer_status = worker.get_printer().poll_status()
+        return {**printer_status.as_dict(), 'ready': printer_status.ready}
+
+
+status_monitor = StatusMonitor()
@@ -0,0 +1,33 @@
+"""
+Per-job stage timings for PrintsAlot.
+Each job carries a dict of stage -> seconds, filled in as it moves through
+the pipeline and reported with its job_update.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# Pipeline stages, in order. Fetch and decode overlap for downloaded images,
+# as do dither and usb when streaming.
+STAGES = ('queue_wait', 'fetch', 'decode', 'resize', 'dither', 'usb', 'cut')
+
+
+def add_time(timings: Optional[Dict[str, float]], stage: str, seconds: float):
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """Add the time spent in the block to `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(timings, stage, time.perf_counter() - start)
+
+
+def as_millis(timings: Dict[str, float]) -> Dict[str, float]:
+    """Timings in milliseconds, in pipeline order, for reports and logs."""
+    ordered = [stage for stage in STAGES if stage in timings] + [s for s in timings if s not in STAGES]
+    return {stage: round(timings[stage] * 1000, 1) for stage in ordered}
@@ -1,15 +1,16 @@
 """
 System tray icon for PrintsAlot Receiver.
 Handles background running with tray icon, menu, and auto-start.
+pystray and Pillow are only imported once the icon is created, on the
+tray thread, so they stay off the startup path.
 """
-import pystray
-from pystray import MenuItem as Item
-from PIL import Image, ImageDraw
 import threading
 import webbrowser
 import sys
 import os
 
+from .config_manager import config_manager
+
 class TrayIcon:
     def __init__(self, port: int = 8080):
         self.port = port
@@ -18,6 +19,8 @@ class TrayIcon:
         
     def _create_icon_image(self, color='#4CAF50'):
         """Create a simple printer icon."""
+        from PIL import Image, ImageDraw
+
         # Create a 64x64 image
         size = 64
         image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
@@ -43,6 +46,8 @@ class TrayIcon:
     def _restart_app(self, icon=None, item=None):
         """Restart the application."""
         icon.stop()
+        # execv skips atexit and the shutdown hooks: save pending config changes first
+        config_manager.flush()
         os.execv(sys.executable, [sys.executable] + sys.argv)
     
     def _quit_app(self, icon=None, item=None):
@@ -56,6 +61,9 @@ class TrayIcon:
     
     def create_menu(self):
         """Create the right-click context menu."""
+        import pystray
+        from pystray import MenuItem as Item
+
         return pystray.Menu(
             Item('Open PrintsAlot', self._open_ui, default=True),
             Item('Restart', self._restart_app),
@@ -65,6 +73,8 @@ class TrayIcon:
     
     def run(self):
         """Run the tray icon (blocking)."""
+        import pystray
+
         self.icon = pystray.Icon(
             'PrintsAlot',
             self._create_icon_image(),
@@ -11,6 +11,8 @@ import aiohttp
 import logging
 from typing import Callable, Optional
 
+from .config_manager import config_manager
+
 logger = logging.getLogger('PrintsAlot.updater')
 
 
@@ -182,6 +184,8 @@ del "%~f0" >nul 2>&1
             # Exit the application to let the updater do its work
             # Give a moment for any UI updates to complete
             await asyncio.sleep(0.5)
+            # os._exit skips atexit and the shutdown hooks: save pending config changes first
+            config_manager.flush()
             os._exit(0)
             return True
         
@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from src.decoder import MAX_HEADER_BYTES, ImageTooLargeError, StreamDecoder
+
+CHUNK = 512
+
+
+def encode(fmt):
+    pixels = np.random.default_rng(0).integers(0, 256, (300, 800, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, fmt)
+    return buf.getvalue()
+
+
+def feed_in_chunks(data, width=384, max_pixels=10 ** 8, **kwargs):
+    decoder = StreamDecoder(width, max_pixels, **kwargs)
+    for offset in range(0, len(data), CHUNK):
+        decoder.feed(data[offset:offset + CHUNK])
+    return decoder
+
+
+@pytest.mark.parametrize('fmt', ['PNG', 'JPEG', 'GIF'])
+def test_chunked_decode_matches_whole_file(fmt):
+    data = encode(fmt)
+
+    result = feed_in_chunks(data).close()
+
+    expected = Image.open(io.BytesIO(data))
+    expected.draft('L', (384, 144))
+    assert result.size == expected.size
+    assert result.mode == expected.mode
+    assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_jpeg_is_decoded_at_reduced_size():
+    result = feed_in_chunks(encode('JPEG')).close()
+
+    assert result.size == (400, 150)
+
+
+@pytest.mark.parametrize('fmt', ['PNG', 'JPEG', 'GIF'])
+def test_truncated_image_fails_on_close(fmt):
+    data = encode(fmt)
+    decoder = feed_in_chunks(data[:len(data) // 2])
+
+    with pytest.raises(OSError):
+        decoder.close()
+
+
+def test_non_image_fails_on_close():
+    decoder = feed_in_chunks(b'<html>not an image</html>')
+
+    with pytest.raises(OSError):
+        decoder.close()
+
+
+def test_non_image_stops_after_header_limit():
+    with pytest.raises(UnidentifiedImageError):
+        feed_in_chunks(b'\0' * (MAX_HEADER_BYTES + 2 * CHUNK))
+
+
+@pytest.mark.parametrize('header_only', [False, True])
+def test_image_over_pixel_budget_is_rejected_from_header(header_only):
+    decoder = StreamDecoder(384, 1000, header_only=header_only)
+
+    with pytest.raises(ImageTooLargeError):
+        decoder.feed(encode('PNG')[:CHUNK])
+    assert decoder.image is None
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.raster import dither, raster_bands, raster_commands, to_grayscale
+
+
+def test_to_grayscale_reduces_1bit_image():
+    img = Image.new('1', (1000, 500), 1)
+    img.paste(0, (0, 0, 500, 500))
+
+    result = to_grayscale(img, 384)
+
+    assert result.mode == 'L'
+    assert result.width == 384
+    pixels = np.asarray(result)
+    assert pixels[:, :100].max() == 0
+    assert pixels[:, -100:].min() == 255
+
+
+def test_to_grayscale_scales_16bit_image():
+    ramp = np.tile(np.linspace(0, 65535, 1000), (500, 1)).astype(np.uint16)
+    img = Image.fromarray(ramp)
+    assert img.mode.startswith('I')
+
+    result = to_grayscale(img, 384)
+
+    assert result.mode == 'L'
+    assert result.width == 384
+    row = np.asarray(result)[0].astype(int)
+    assert row[0] < 10
+    assert row[-1] > 245
+    # A full 16-bit ramp stays a ramp rather than clipping to white
+    assert 100 < row[len(row) // 2] < 155
+
+
+@pytest.mark.parametrize('mode', ['floyd', 'bayer', 'threshold'])
+@pytest.mark.parametrize('band_rows', [100, 256, 1000])
+def test_streamed_bands_match_unstreamed_raster(mode, band_rows):
+    # Taller than one GS v 0 block, with band sizes that don't line up with
+    # blocks or the Bayer matrix
+    pixels = np.random.default_rng(0).integers(0, 256, (2001, 384), dtype=np.uint8)
+    img = Image.fromarray(pixels)
+
+    streamed = b''.join(raster_bands(img, mode, band_rows))
+
+    assert streamed == raster_commands(dither(img, mode))